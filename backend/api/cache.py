@@ -0,0 +1,112 @@
+import time
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.cache import parse_etags
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def get_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def cache_is_shared():
+    """Видят ли записи кэша API другие процессы (у LocMemCache — нет)."""
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+def version_key(name):
+    return f'version:{name}'
+
+
+def new_version():
+    return int(time.time() * 1000)
+
+
+def get_versions(*names):
+    """
+    Текущие версии ключей кэша. Потерянная версия заменяется новой,
+    чтобы не отдать записи, закэшированные под старым номером.
+    """
+    cache = get_cache()
+    keys = [version_key(name) for name in names]
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_version(name):
+    """Меняет версию; возвращает новую или None, если её пришлось создать."""
+    cache = get_cache()
+    try:
+        return cache.incr(version_key(name))
+    except ValueError:
+        cache.set(version_key(name), new_version(), None)
+
+
+class CachedResponseMixin:
+    """
+    Кэширует ответы list и retrieve по пути и параметрам запроса.
+    Версия кэша меняется при сохранении и удалении объектов модели,
+    условные GET с ETag/Last-Modified получают 304 без сериализации.
+    """
+
+    def get_cache_version_name(self):
+        return self.queryset.model._meta.label_lower
+
+    def get_response_cache_key(self, request):
+        version, = get_versions(self.get_cache_version_name())
+        params = sorted(
+            (key, request.query_params.getlist(key))
+            for key in request.query_params
+        )
+        return md5(repr((
+            version, request.path, params, request.accepted_media_type
+        )).encode()).hexdigest()
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key = self.get_response_cache_key(request)
+        etag = f'"{key}"'
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and etag in parse_etags(if_none_match):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag}
+            )
+        cache = get_cache()
+        entry = cache.get(f'response:{key}')
+        if entry is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = (response.data, int(time.time()))
+            cache.set(
+                f'response:{key}', entry, settings.API_RESPONSE_CACHE_TTL
+            )
+        data, last_modified = entry
+        headers = {'ETag': etag, 'Last-Modified': http_date(last_modified)}
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE')
+        )
+        if not if_none_match and if_modified_since and (
+            if_modified_since >= last_modified
+        ):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED, headers=headers
+            )
+        return Response(data, headers=headers)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
@@ -0,0 +1,83 @@
+import csv
+import json
+
+from rest_framework import renderers
+
+EXPORTERS = {}
+
+
+def register_exporter(exporter):
+    EXPORTERS[exporter.format] = exporter
+    return exporter
+
+
+class BaseExporter(renderers.BaseRenderer):
+    """
+    Рендерер списка покупок: stream() отдаёт документ по частям,
+    render() используется DRF для ответов с ошибками.
+    """
+    charset = 'utf-8'
+    extension = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return str(data).encode(self.charset)
+
+    def stream(self, title, rows):
+        raise NotImplementedError
+
+
+@register_exporter
+class TextExporter(BaseExporter):
+    media_type = 'text/plain'
+    format = 'txt'
+    extension = 'txt'
+
+    def stream(self, title, rows):
+        yield f'{title}\n'
+        for row in rows:
+            yield (
+                f'{row["name"]}: {row["amount"]} {row["measurement_unit"]}\n'
+            )
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+@register_exporter
+class CSVExporter(BaseExporter):
+    media_type = 'text/csv'
+    format = 'csv'
+    extension = 'csv'
+
+    def stream(self, title, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'amount', 'measurement_unit'))
+        for row in rows:
+            yield writer.writerow(
+                (row['name'], row['amount'], row['measurement_unit'])
+            )
+
+
+@register_exporter
+class JSONExporter(BaseExporter):
+    media_type = 'application/json'
+    format = 'json'
+    extension = 'json'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+    def stream(self, title, rows):
+        yield f'{{"title": {json.dumps(title, ensure_ascii=False)}, '
+        yield '"ingredients": ['
+        separator = ''
+        for row in rows:
+            yield separator + json.dumps(row, ensure_ascii=False)
+            separator = ', '
+        yield ']}'
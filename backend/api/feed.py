@@ -0,0 +1,104 @@
+from django.conf import settings
+from django.db import transaction
+
+from .cache import bump_version, cache_is_shared, get_cache, get_versions
+
+
+def cache_ttl(ttl):
+    """
+    TTL записей, которые сбрасываются версиями и удалением ключей.
+    С кэшем, локальным для процесса, изменения из других процессов
+    сюда не доходят, поэтому записи живут не дольше
+    RECIPE_LOCAL_CACHE_TTL.
+    """
+    if cache_is_shared():
+        return ttl
+    return min(ttl, settings.RECIPE_LOCAL_CACHE_TTL)
+
+
+def recipe_version_name(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def bump_recipe_versions(recipe_ids):
+    """
+    Новые версии тел рецептов после коммита: иначе параллельный запрос
+    может прочитать новую версию со старыми строками и закэшировать их.
+    """
+    recipe_ids = list(recipe_ids)
+
+    def bump():
+        for recipe_id in recipe_ids:
+            bump_version(recipe_version_name(recipe_id))
+
+    transaction.on_commit(bump)
+
+
+def overlay_key(user_id):
+    return f'recipe-overlay:{user_id}'
+
+
+def invalidate_user_overlay(user_id):
+    get_cache().delete(overlay_key(user_id))
+
+
+def get_user_overlay(user):
+    """Id избранных рецептов, рецептов в корзине и авторов в подписках."""
+    if user.is_anonymous:
+        return None
+    cache = get_cache()
+    overlay = cache.get(overlay_key(user.id))
+    if overlay is None:
+        overlay = {
+            'favourites': set(
+                user.favourites.values_list('recipe_id', flat=True)
+            ),
+            'carts': set(user.carts.values_list('recipe_id', flat=True)),
+            'following': set(
+                user.follower.values_list('author_id', flat=True)
+            ),
+        }
+        cache.set(
+            overlay_key(user.id),
+            overlay,
+            cache_ttl(settings.RECIPE_OVERLAY_CACHE_TTL)
+        )
+    return overlay
+
+
+def get_recipe_bodies(recipe_ids, request, serialize):
+    """
+    Общие для всех пользователей сериализованные рецепты в порядке
+    recipe_ids; недостающие в кэше сериализуются через serialize(ids).
+    Удалённые рецепты пропускаются.
+    """
+    cache = get_cache()
+    versions = get_versions(*map(recipe_version_name, recipe_ids))
+    keys = {
+        recipe_id: f'recipe-body:{request.get_host()}:{recipe_id}:{version}'
+        for recipe_id, version in zip(recipe_ids, versions)
+    }
+    bodies = cache.get_many(keys.values())
+    missing = [
+        recipe_id for recipe_id, key in keys.items() if key not in bodies
+    ]
+    if missing:
+        fresh = {keys[body['id']]: body for body in serialize(missing)}
+        cache.set_many(fresh, cache_ttl(settings.RECIPE_BODY_CACHE_TTL))
+        bodies.update(fresh)
+    return [
+        bodies[keys[recipe_id]] for recipe_id in recipe_ids
+        if keys[recipe_id] in bodies
+    ]
+
+
+def apply_overlay(body, overlay):
+    recipe = dict(body)
+    recipe['author'] = dict(body['author'])
+    if overlay is not None:
+        recipe['is_favorited'] = recipe['id'] in overlay['favourites']
+        recipe['is_in_shopping_cart'] = recipe['id'] in overlay['carts']
+        recipe['author']['is_subscribed'] = (
+            recipe['author']['id'] in overlay['following']
+        )
+    return recipe
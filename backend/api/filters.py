@@ -1,31 +1,78 @@
 import django_filters
+from django.conf import settings
 from django_filters.rest_framework import filters
 
-from recipes.models import Ingredient, Recipe, Tag, User
+from recipes.models import Ingredient, Recipe, User
+from .indexes import bitset_size, from_bitset, tag_index
+
+TAGS_MODE_CHOICES = (('or', 'Любой из тегов'), ('and', 'Все теги'))
+
+
+def tag_choices():
+    return [(slug, slug) for slug in tag_index.slugs()]
 
 
 class RecipeFilter(django_filters.FilterSet):
-    tags = django_filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices, method='filter_tags'
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=TAGS_MODE_CHOICES, method='filter_tags_mode'
     )
     author = django_filters.ModelChoiceFilter(queryset=User.objects.all())
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'tags',
+            'tags_mode',
+            'author',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'search'
+        )
+
+    def filter_tags(self, queryset, name, value):
+        """
+        Id рецептов с нужными тегами берутся из индекса в памяти; слишком
+        длинный список id заменяется подзапросами по связям тегов.
+        """
+        if not value:
+            return queryset
+        match_all = self.form.cleaned_data.get('tags_mode') == 'and'
+        recipes = tag_index.filter(value, match_all)
+        if not recipes:
+            return queryset.none()
+        if bitset_size(recipes) <= settings.TAG_FILTER_MAX_IDS:
+            return queryset.filter(id__in=from_bitset(recipes))
+        links = Recipe.tags.through.objects.values('recipe_id')
+        if not match_all:
+            return queryset.filter(id__in=links.filter(tag__slug__in=value))
+        for slug in value:
+            queryset = queryset.filter(id__in=links.filter(tag__slug=slug))
+        return queryset
+
+    def filter_tags_mode(self, queryset, name, value):
+        # учитывается в filter_tags
+        return queryset
 
     def filter_is_favorited(self, queryset, name, value):
         if value:
-            return queryset.filter(favourites__user=self.request.user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if value:
-            return queryset.filter(carts__user=self.request.user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        value = value.strip()
+        if not value:
+            return queryset
+        return queryset.search(value)
@@ -0,0 +1,154 @@
+import base64
+import binascii
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+from recipes.models import Recipe
+from .feed import bump_recipe_versions
+from .storage import RAW_PREFIX, sniff_extension
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp', 'PNG': 'png'}
+
+
+class RawBase64ImageField(serializers.FileField):
+    """
+    Картинка в base64. Формат определяется по сигнатуре, файл
+    сохраняется как есть, а Pillow обрабатывает его уже в фоне.
+    """
+    default_error_messages = {
+        'invalid': 'Ожидается изображение в base64.',
+        'invalid_image': 'Загрузите корректное изображение.',
+        'too_large': 'Изображение больше {max_size} байт.',
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail('invalid')
+        if data.startswith('data:'):
+            data = data.partition(';base64,')[2]
+        try:
+            decoded = base64.b64decode(data)
+        except (binascii.Error, ValueError):
+            self.fail('invalid_image')
+        if len(decoded) > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.fail('too_large', max_size=settings.IMAGE_UPLOAD_MAX_SIZE)
+        extension = sniff_extension(decoded[:16])
+        if extension is None:
+            self.fail('invalid_image')
+        return super().to_internal_value(ContentFile(
+            decoded, name=f'{RAW_PREFIX}{uuid4().hex}.{extension}'
+        ))
+
+
+def is_raw(name):
+    return os.path.basename(name).startswith(RAW_PREFIX)
+
+
+def encode(image, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = BytesIO()
+    image.save(
+        buffer, image_format, quality=settings.IMAGE_QUALITY, optimize=True
+    )
+    return ContentFile(buffer.getvalue())
+
+
+def process_image(storage, name):
+    """
+    Поворачивает по EXIF и убирает метаданные, уменьшает до
+    IMAGE_MAX_DIMENSION и перекодирует в IMAGE_FORMAT.
+    Возвращает имя нового файла.
+    """
+    with storage.open(name, 'rb') as file:
+        image = Image.open(file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(
+        (settings.IMAGE_MAX_DIMENSION,) * 2, Image.Resampling.LANCZOS
+    )
+    image_format = settings.IMAGE_FORMAT.upper()
+    stem = os.path.splitext(os.path.basename(name))[0][len(RAW_PREFIX):]
+    return storage.save(
+        os.path.join(
+            os.path.dirname(name), f'{stem}.{EXTENSIONS[image_format]}'
+        ),
+        encode(image, image_format)
+    )
+
+
+def process_recipe_image(recipe_id):
+    recipe = Recipe.objects.filter(id=recipe_id).only('id', 'image').first()
+    if recipe is None or not recipe.image or not is_raw(recipe.image.name):
+        return
+    source = recipe.image.name
+    storage = recipe.image.storage
+    try:
+        processed = process_image(storage, source)
+    except (OSError, Image.DecompressionBombError):
+        logger.warning('Не удалось обработать %s', source, exc_info=True)
+        return
+    # картинку могли заменить, пока шла обработка; ненужные файлы
+    # (в том числе исходник) удалит gc_media, они могут быть общими
+    if not Recipe.objects.filter(id=recipe_id, image=source).update(
+            image=processed
+    ):
+        return
+    recipe.image.name = processed
+    from .renditions import generate_renditions
+    generate_renditions(recipe.image)
+    bump_recipe_versions((recipe_id,))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_PROCESSING_WORKERS,
+                thread_name_prefix='images'
+            )
+        return _executor
+
+
+def process_in_thread(recipe_id):
+    try:
+        process_recipe_image(recipe_id)
+    finally:
+        connections.close_all()
+
+
+def dispatch(recipe_id):
+    backend = settings.IMAGE_PROCESSING_BACKEND
+    if backend == 'celery':
+        from .tasks import process_recipe_image_task
+        return process_recipe_image_task.delay(recipe_id)
+    if backend == 'thread':
+        return get_executor().submit(process_in_thread, recipe_id)
+    return process_recipe_image(recipe_id)
+
+
+def schedule_image_processing(recipe_id):
+    """Ставит обработку картинки в очередь после коммита транзакции."""
+    transaction.on_commit(lambda: dispatch(recipe_id))
@@ -0,0 +1,310 @@
+import bisect
+import threading
+import time
+from array import array
+from collections import Counter, namedtuple
+
+from django.conf import settings
+
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+from .cache import bump_version, get_versions
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения:
+    отсортированный список названий для поиска по началу строки
+    и словарь триграмм для поиска по вхождению.
+    """
+    ngram_size = 3
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def invalidate(self):
+        self._state = None
+
+    def _build(self):
+        ingredients = sorted(
+            Ingredient.objects.all(),
+            key=lambda ingredient: (ingredient.name.lower(), ingredient.id)
+        )
+        names = [ingredient.name.lower() for ingredient in ingredients]
+        ngrams = {}
+        for position, name in enumerate(names):
+            for start in range(len(name) - self.ngram_size + 1):
+                ngrams.setdefault(
+                    name[start:start + self.ngram_size], set()
+                ).add(position)
+        return time.monotonic(), ingredients, names, ngrams
+
+    def _get_state(self):
+        state = self._state
+        ttl = settings.INGREDIENT_INDEX_TTL
+        if state is None or time.monotonic() - state[0] > ttl:
+            with self._lock:
+                state = self._state
+                if state is None or time.monotonic() - state[0] > ttl:
+                    state = self._state = self._build()
+        return state
+
+    def _contains(self, names, ngrams, name):
+        if len(name) < self.ngram_size:
+            return [
+                position for position, indexed in enumerate(names)
+                if name in indexed
+            ]
+        candidates = sorted(
+            (
+                ngrams.get(name[start:start + self.ngram_size], set())
+                for start in range(len(name) - self.ngram_size + 1)
+            ),
+            key=len
+        )
+        positions = set.intersection(*candidates)
+        return sorted(
+            position for position in positions if name in names[position]
+        )
+
+    def search(self, name):
+        """Сначала ингредиенты, начинающиеся с name, затем содержащие его."""
+        _, ingredients, names, ngrams = self._get_state()
+        name = name.lower()
+        start = bisect.bisect_left(names, name)
+        end = start
+        while end < len(names) and names[end].startswith(name):
+            end += 1
+        found = ingredients[start:end]
+        found.extend(
+            ingredients[position]
+            for position in self._contains(names, ngrams, name)
+            if not start <= position < end
+        )
+        return found
+
+
+ingredient_index = IngredientIndex()
+
+
+Match = namedtuple('Match', 'recipe_id coverage missing ingredients')
+
+
+class SharedIndex:
+    """
+    Индекс по рецептам в памяти процесса. Процессы узнают об изменениях
+    по общей версии в кэше: тот, кто менял рецепты, правит свой индекс
+    на месте через _patch, остальные перестраивают его через _build.
+    С кэшем, локальным для процесса (LocMemCache), версия другим
+    процессам не видна, поэтому индекс ещё и перестраивается не реже
+    раза в RECIPE_INDEX_TTL секунд.
+    """
+    version_name = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def invalidate(self):
+        self._state = None
+        bump_version(self.version_name)
+
+    def _build(self):
+        raise NotImplementedError
+
+    def _patch(self, data, recipe_ids):
+        raise NotImplementedError
+
+    def _is_fresh(self, state, version):
+        return state is not None and state[0] == version and (
+            time.monotonic() - state[1] <= settings.RECIPE_INDEX_TTL
+        )
+
+    def _get_data(self):
+        version, = get_versions(self.version_name)
+        state = self._state
+        if not self._is_fresh(state, version):
+            with self._lock:
+                state = self._state
+                if not self._is_fresh(state, version):
+                    state = self._state = (
+                        version, time.monotonic(), self._build()
+                    )
+        return state[2]
+
+    def update(self, recipe_ids):
+        """Перечитывает из базы данные рецептов recipe_ids."""
+        recipe_ids = set(recipe_ids)
+        if not recipe_ids:
+            return
+        with self._lock:
+            state = self._state
+            version = bump_version(self.version_name)
+            # индекс не построен, устарел или версию менял кто-то ещё
+            if state is None or version != state[0] + 1:
+                self._state = None
+                return
+            # _patch возвращает новые объекты вместо правки на месте:
+            # поиск в других потоках работает со старыми; время сборки
+            # не меняется, чужие изменения подтянет перестройка по ttl
+            self._state = (
+                version, state[1], self._patch(state[2], recipe_ids)
+            )
+
+
+class RecipeIngredientIndex(SharedIndex):
+    """
+    Обратный индекс ингредиент -> отсортированный массив id рецептов
+    и прямой рецепт -> id его ингредиентов.
+    """
+    version_name = 'recipe-ingredient-index'
+
+    def _build(self):
+        postings = {}
+        recipes = {}
+        for ingredient_id, recipe_id in IngredientAmount.objects.order_by(
+                'ingredient_id', 'recipe_id'
+        ).values_list('ingredient_id', 'recipe_id').iterator():
+            postings.setdefault(ingredient_id, array('I')).append(recipe_id)
+            recipes.setdefault(recipe_id, []).append(ingredient_id)
+        return postings, {
+            recipe_id: tuple(ingredients)
+            for recipe_id, ingredients in recipes.items()
+        }
+
+    def _patch(self, data, recipe_ids):
+        postings, recipes = map(dict, data)
+        current = {recipe_id: [] for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in IngredientAmount.objects.filter(
+                recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id'):
+            current[recipe_id].append(ingredient_id)
+        for recipe_id, ingredients in current.items():
+            old = set(recipes.pop(recipe_id, ()))
+            new = set(ingredients)
+            for ingredient_id in old - new:
+                posting = array('I', postings[ingredient_id])
+                posting.remove(recipe_id)
+                if posting:
+                    postings[ingredient_id] = posting
+                else:
+                    del postings[ingredient_id]
+            for ingredient_id in new - old:
+                posting = array('I', postings.get(ingredient_id, ()))
+                posting.insert(
+                    bisect.bisect_left(posting, recipe_id), recipe_id
+                )
+                postings[ingredient_id] = posting
+            if new:
+                recipes[recipe_id] = tuple(sorted(new))
+        return postings, recipes
+
+    def search(self, ingredient_ids, max_missing=None):
+        """
+        Рецепты, в которых есть хотя бы один из ingredient_ids, по убыванию
+        доли имеющихся ингредиентов, затем по числу недостающих.
+        """
+        postings, recipes = self._get_data()
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(postings.get(ingredient_id, ()))
+        found = []
+        for recipe_id, count in matched.items():
+            ingredients = recipes[recipe_id]
+            missing = len(ingredients) - count
+            if max_missing is None or missing <= max_missing:
+                found.append(Match(
+                    recipe_id, count / len(ingredients), missing, ingredients
+                ))
+        found.sort(key=lambda match: (
+            -match.coverage, match.missing, -match.recipe_id
+        ))
+        return found
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
+
+
+def to_bitset(ids):
+    """Множество неотрицательных чисел как int: бит n — число n."""
+    if not ids:
+        return 0
+    data = bytearray(max(ids) // 8 + 1)
+    for number in ids:
+        data[number >> 3] |= 1 << (number & 7)
+    return int.from_bytes(data, 'little')
+
+
+def from_bitset(bitset):
+    """Числа из bitset по возрастанию."""
+    numbers = []
+    data = bitset.to_bytes((bitset.bit_length() + 7) // 8, 'little')
+    for position, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            numbers.append(position * 8 + low.bit_length() - 1)
+            byte ^= low
+    return numbers
+
+
+def bitset_size(bitset):
+    return bin(bitset).count('1')
+
+
+class TagIndex(SharedIndex):
+    """
+    Slug тега -> множество id его рецептов в виде битовой маски (int).
+    Теги фильтруются и считаются побитовыми операциями без запросов.
+    """
+    version_name = 'tag-index'
+
+    def _build(self):
+        ids = {}
+        # LEFT JOIN: теги без рецептов приходят с recipe_id = None
+        for slug, recipe_id in Tag.objects.values_list(
+                'slug', 'recipes__id'
+        ).iterator():
+            recipe_ids = ids.setdefault(slug, [])
+            if recipe_id is not None:
+                recipe_ids.append(recipe_id)
+        return {
+            slug: to_bitset(recipe_ids) for slug, recipe_ids in ids.items()
+        }
+
+    def _patch(self, bitsets, recipe_ids):
+        current = {}
+        for recipe_id, slug in Recipe.tags.through.objects.filter(
+                recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'tag__slug'):
+            current.setdefault(slug, set()).add(recipe_id)
+        mask = to_bitset(recipe_ids)
+        return {
+            slug: bitset & ~mask | to_bitset(current.get(slug, ()))
+            for slug, bitset in bitsets.items()
+        }
+
+    def slugs(self):
+        return sorted(self._get_data())
+
+    def filter(self, slugs, match_all=False):
+        """Рецепты хотя бы с одним из тегов slugs или со всеми сразу."""
+        bitsets = self._get_data()
+        selected = [bitsets.get(slug, 0) for slug in set(slugs)]
+        if not selected:
+            return 0
+        result = selected[0]
+        for bitset in selected[1:]:
+            result = result & bitset if match_all else result | bitset
+        return result
+
+    def counts(self, selected=None):
+        """Число рецептов с каждым тегом среди selected (или среди всех)."""
+        return {
+            slug: bitset_size(
+                bitset if selected is None else bitset & selected
+            )
+            for slug, bitset in self._get_data().items()
+        }
+
+
+tag_index = TagIndex()
@@ -0,0 +1,82 @@
+import posixpath
+import time
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from api.cache import get_cache
+from api.renditions import RENDITIONS_DIR, hash_key, ready_key, source_hash
+from recipes.models import Recipe
+
+
+def walk(storage, directory):
+    directories, files = storage.listdir(directory)
+    for name in files:
+        if not name.startswith('.'):
+            yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = 'Удаляет картинки и их размеры, на которые не ссылаются рецепты'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', default=24 * 60 * 60, type=int,
+            help='Не трогать файлы моложе стольких секунд'
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        references = Counter(dict(
+            Recipe.objects.exclude(image='').order_by().values(
+                'image'
+            ).annotate(count=Count('id')).values_list('image', 'count')
+        ))
+        hashes = {
+            source_hash(storage, name) for name in references
+        } - {None}
+        deadline = time.time() - options['min_age']
+        removed = freed = kept = 0
+        for directory in (
+                *getattr(storage, 'content_addressed_dirs', ('recipes',)),
+                RENDITIONS_DIR
+        ):
+            if not storage.exists(directory):
+                continue
+            for name in walk(storage, directory):
+                if name.startswith(f'{RENDITIONS_DIR}/locks/'):
+                    continue
+                if name.startswith(f'{RENDITIONS_DIR}/'):
+                    digest, _, rendition = posixpath.splitext(
+                        posixpath.basename(name)
+                    )[0].partition('_')
+                    used = digest in hashes
+                else:
+                    digest, rendition = None, None
+                    used = name in references
+                if used or storage.get_modified_time(
+                        name
+                ).timestamp() > deadline:
+                    kept += 1
+                    continue
+                removed += 1
+                freed += storage.size(name)
+                if options['dry_run']:
+                    continue
+                storage.delete(name)
+                get_cache().delete(
+                    ready_key(digest, rendition) if digest
+                    else hash_key(name)
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Пробный запуск. " if options["dry_run"] else ""}'
+            f'Картинок в рецептах: {len(references)} '
+            f'(ссылок {sum(references.values())}), '
+            f'оставлено файлов: {kept}, удалено: {removed}, '
+            f'освобождено {freed} байт'
+        ))
@@ -1,33 +1,17 @@
-import csv
-import os
-
-from django.conf import settings
-from django.core.management.base import BaseCommand, CommandError
-
+from api.indexes import ingredient_index
+from api.management.loaders import CACHE_HELP, LoadCommand
 from recipes.models import Ingredient
 
-DATA_ROOT = os.path.join(settings.BASE_DIR, 'data')
-
-
-class Command(BaseCommand):
-    help = 'Loading ingredients from data in json or csv'
 
-    def add_arguments(self, parser):
-        parser.add_argument('filename', default='ingredients.csv', nargs='?',
-                            type=str)
+class Command(LoadCommand):
+    help = f'Loading ingredients from data in json or csv. {CACHE_HELP}'
+    model = Ingredient
+    fields = ('name', 'measurement_unit')
+    key_fields = ('name', 'measurement_unit')
+    default_filename = 'ingredients.csv'
 
-    def handle(self, *args, **options):
-        try:
-            with open(os.path.join(DATA_ROOT, options['filename']), 'r',
-                      encoding='utf-8') as f:
-                data = csv.reader(f)
-                for row in data:
-                    name, measurement_unit = row
-                    Ingredient.objects.get_or_create(
-                        name=name,
-                        measurement_unit=measurement_unit
-                    )
-        except FileNotFoundError:
-            raise CommandError(
-                'Добавьте файл ingredients.csv в директорию data'
-            )
\ No newline at end of file
+    def after_load(self):
+        # bulk-вставка не шлёт post_save; индекс этого процесса, веб-сервер
+        # перечитает свой по INGREDIENT_INDEX_TTL
+        super().after_load()
+        ingredient_index.invalidate()
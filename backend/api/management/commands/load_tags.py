@@ -1,32 +1,42 @@
-import csv
-import os
+from django.core.management.base import CommandError
 
-from django.conf import settings
-from django.core.management.base import BaseCommand, CommandError
+from api.indexes import tag_index
+from api.management.loaders import CACHE_HELP, LoadCommand
+from recipes.models import Tag, User
 
-from recipes.models import Tag
 
-DATA_ROOT = os.path.join(settings.BASE_DIR, 'data')
-
-
-class Command(BaseCommand):
+class Command(LoadCommand):
     """
-    Добавляем тэги из файла CSV
+    Добавляем тэги из файла CSV или JSON
     """
+    help = f'Загружает теги из файла csv или json. {CACHE_HELP}'
+    model = Tag
+    fields = ('name', 'color', 'slug')
+    key_fields = ('slug',)
+    default_filename = 'tags.csv'
+
     def add_arguments(self, parser):
-        parser.add_argument('filename', default='tags.csv', nargs='?',
-                            type=str)
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--author',
+            help='Email автора тегов, по умолчанию первый суперпользователь'
+        )
+
+    def get_extra(self, options):
+        if options['author']:
+            author = User.objects.filter(email=options['author']).first()
+        else:
+            author = User.objects.filter(
+                is_superuser=True
+            ).order_by('id').first()
+        if author is None:
+            raise CommandError(
+                'Укажите автора тегов через --author '
+                'или создайте суперпользователя'
+            )
+        return {'author_id': author.id}
 
-    def handle(self, *args, **options):
-        try:
-            with open(os.path.join(DATA_ROOT, options['filename']), 'r',
-                      encoding='utf-8') as f:
-                datareader = csv.reader(f)
-                for row in datareader:
-                    Tag.objects.get_or_create(
-                        name=row[0],
-                        color=row[1],
-                        slug=row[2]
-                    )
-        except FileNotFoundError:
-            raise CommandError('Добавьте файл tags.csv в директорию data')
\ No newline at end of file
+    def after_load(self):
+        # bulk-вставка не шлёт post_save, новых slug нет в индексе тегов
+        super().after_load()
+        tag_index.invalidate()
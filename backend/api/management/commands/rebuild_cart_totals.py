@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import CartIngredientTotal
+
+
+class Command(BaseCommand):
+    help = 'Rebuilding or checking the shopping cart ingredient totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report totals that differ from the carts'
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            return self.check_drift()
+        with transaction.atomic():
+            count = CartIngredientTotal.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано строк: {count}'))
+
+    def check_drift(self):
+        expected = {
+            (row['user'], row['ingredient']): row['total']
+            for row in CartIngredientTotal.objects.expected().iterator()
+        }
+        stored = {
+            (row['user'], row['ingredient']): row['amount']
+            for row in CartIngredientTotal.objects.filter(
+                amount__gt=0
+            ).values('user', 'ingredient', 'amount').iterator()
+        }
+        drift = [
+            (key, stored.get(key), expected.get(key))
+            for key in sorted(expected.keys() | stored.keys())
+            if stored.get(key) != expected.get(key)
+        ]
+        for (user, ingredient), actual, total in drift:
+            self.stdout.write(
+                f'user={user} ingredient={ingredient}: '
+                f'сохранено {actual}, должно быть {total}'
+            )
+        if drift:
+            raise CommandError(f'Расхождений: {len(drift)}')
+        self.stdout.write(self.style.SUCCESS('Расхождений нет'))
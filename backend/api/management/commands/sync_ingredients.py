@@ -0,0 +1,132 @@
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.cache import bump_version
+from api.feed import bump_recipe_versions
+from api.indexes import ingredient_index
+from api.management.loaders import (
+    CACHE_HELP,
+    BulkLoader,
+    iter_file_rows,
+    warn_if_cache_is_local
+)
+from recipes.models import Ingredient, IngredientAmount, Recipe
+
+FIELDS = ('name', 'measurement_unit')
+
+
+def batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Command(BaseCommand):
+    help = (
+        'Синхронизирует справочник ингредиентов с файлом csv или json. '
+        f'{CACHE_HELP}'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('filename', default='ingredients.csv',
+                            nargs='?', type=str)
+        parser.add_argument('--batch-size', default=1000, type=int)
+        parser.add_argument(
+            '--delete', action='store_true',
+            help='Удалить отсутствующие в файле ингредиенты, '
+                 'если они не используются в рецептах'
+        )
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что изменится')
+
+    def diff(self, filename):
+        """
+        Сравнивает файл с таблицей по парам (name, measurement_unit).
+        Если у названия в файле и в базе ровно по одной несовпадающей
+        единице измерения, строка обновляется на месте, чтобы сохранить
+        ссылки из рецептов.
+        """
+        incoming = dict.fromkeys(
+            (row['name'], row['measurement_unit'])
+            for row in iter_file_rows(filename, FIELDS)
+        )
+        existing = {
+            (name, unit): pk
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id', *FIELDS
+            )
+        }
+        added = defaultdict(list)
+        for name, unit in incoming:
+            if (name, unit) not in existing:
+                added[name].append(unit)
+        removed = defaultdict(list)
+        for (name, unit), pk in existing.items():
+            if (name, unit) not in incoming:
+                removed[name].append(pk)
+        updates = {}
+        for name, units in added.items():
+            if len(units) == 1 and len(removed.get(name, ())) == 1:
+                updates[removed.pop(name)[0]] = units.pop()
+        inserts = [
+            {'name': name, 'measurement_unit': unit}
+            for name, units in added.items() for unit in units
+        ]
+        deletes = [pk for pks in removed.values() for pk in pks]
+        return len(incoming), inserts, updates, deletes
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        started = time.monotonic()
+        read, inserts, updates, deletes = self.diff(options['filename'])
+        kept = []
+        if options['delete']:
+            used = set(IngredientAmount.objects.filter(
+                ingredient_id__in=deletes
+            ).values_list('ingredient_id', flat=True)) if deletes else set()
+            kept = [pk for pk in deletes if pk in used]
+            deletes = [pk for pk in deletes if pk not in used]
+        else:
+            kept, deletes = deletes, []
+        if not options['dry_run']:
+            self.apply(inserts, updates, deletes, batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Пробный запуск. " if options["dry_run"] else ""}'
+            f'В файле {read}: добавлено {len(inserts)}, '
+            f'изменено {len(updates)}, удалено {len(deletes)}, '
+            f'оставлено отсутствующих в файле {len(kept)} '
+            f'за {time.monotonic() - started:.2f} с'
+        ))
+
+    def apply(self, inserts, updates, deletes, batch_size):
+        loader = BulkLoader(
+            Ingredient, FIELDS, FIELDS, batch_size=batch_size
+        )
+        with transaction.atomic():
+            for batch in batches(inserts, batch_size):
+                loader.insert(batch)
+            Ingredient.objects.bulk_update(
+                [
+                    Ingredient(id=pk, measurement_unit=unit)
+                    for pk, unit in updates.items()
+                ],
+                ['measurement_unit'],
+                batch_size=batch_size
+            )
+            for batch in batches(deletes, batch_size):
+                Ingredient.objects.filter(id__in=batch).delete()
+        if not (inserts or updates or deletes):
+            return
+        # массовые операции не шлют сигналы, версии в кэше меняем сами;
+        # веб-сервер их увидит только при общем кэше
+        ingredient_index.invalidate()
+        bump_version('recipes.ingredient')
+        if updates:
+            bump_recipe_versions(Recipe.objects.filter(
+                ingredients__ingredient_id__in=list(updates)
+            ).values_list('id', flat=True).distinct())
+        warn_if_cache_is_local(self)
@@ -0,0 +1,216 @@
+import csv
+import io
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from api.cache import bump_version, cache_is_shared
+
+DATA_ROOT = os.path.join(settings.BASE_DIR, 'data')
+CACHE_HELP = (
+    'Кэши API сбрасываются в запущенном веб-сервере, только если '
+    'CACHE_BACKEND общий для процессов (redis, memcached)'
+)
+
+
+def warn_if_cache_is_local(command):
+    """
+    Сброс версий в кэше команды не доходит до веб-сервера, если кэш
+    локален для процесса: предупреждаем, что ответы API пока устарели.
+    """
+    if not cache_is_shared():
+        command.stderr.write(command.style.WARNING(
+            'Кэш API локален для процесса команды: веб-сервер будет '
+            'отдавать старые данные до перезапуска или истечения TTL'
+        ))
+
+
+def iter_json_array(file, chunk_size=64 * 1024):
+    """Потоково читает JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in iter(lambda: file.read(chunk_size), ''):
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and (
+                    buffer[position].isspace() or buffer[position] in ',['
+            ):
+                if buffer[position] == '[':
+                    started = True
+                position += 1
+            if position == len(buffer) or buffer[position] == ']':
+                break
+            if not started:
+                raise ValueError('Ожидается JSON-массив')
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break
+            yield item
+        buffer = buffer[position:]
+    if buffer.strip() not in ('', ']'):
+        raise ValueError('Некорректный JSON')
+
+
+def read_rows(file, fields, file_format):
+    """Строки файла в виде словарей с ключами fields."""
+    if file_format == 'json':
+        for item in iter_json_array(file):
+            yield {field: str(item[field]).strip() for field in fields}
+        return
+    for line, row in enumerate(csv.reader(file), start=1):
+        if not row:
+            continue
+        if len(row) != len(fields):
+            raise ValueError(
+                f'Строка {line}: ожидается {len(fields)} столбца, '
+                f'получено {len(row)}'
+            )
+        yield {
+            field: value.strip() for field, value in zip(fields, row)
+        }
+
+
+def iter_file_rows(filename, fields):
+    """Строки файла из директории data (csv или json по расширению)."""
+    path = os.path.join(DATA_ROOT, filename)
+    file_format = os.path.splitext(path)[1].lstrip('.').lower()
+    if file_format not in ('csv', 'json'):
+        raise CommandError('Поддерживаются только файлы csv и json')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from read_rows(f, fields, file_format)
+    except FileNotFoundError:
+        raise CommandError(f'Добавьте файл {filename} в директорию data')
+    except (KeyError, ValueError) as error:
+        raise CommandError(f'Ошибка в файле: {error}')
+
+
+class BulkLoader:
+    """
+    Вставляет новые строки пачками: ключи уже существующих объектов
+    выбираются одним запросом, дубликаты отсекаются в памяти.
+    На PostgreSQL пачки идут через COPY, иначе через bulk_create.
+    """
+
+    def __init__(self, model, fields, key_fields, batch_size=1000,
+                 use_copy=True, extra=None, using=DEFAULT_DB_ALIAS):
+        self.model = model
+        self.fields = fields
+        self.key_fields = key_fields
+        self.batch_size = batch_size
+        self.extra = extra or {}
+        self.using = using
+        self.use_copy = (
+            use_copy and connections[using].vendor == 'postgresql'
+        )
+
+    def existing_keys(self):
+        return set(
+            self.model.objects.using(self.using).values_list(
+                *self.key_fields
+            )
+        )
+
+    def load(self, rows):
+        """Возвращает (прочитано строк, вставлено строк)."""
+        read = inserted = 0
+        batch = []
+        with transaction.atomic(using=self.using):
+            seen = self.existing_keys()
+            for row in rows:
+                read += 1
+                key = tuple(row[field] for field in self.key_fields)
+                if key in seen:
+                    continue
+                seen.add(key)
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    inserted += self.insert(batch)
+                    batch = []
+            if batch:
+                inserted += self.insert(batch)
+        return read, inserted
+
+    def insert(self, batch):
+        if self.use_copy:
+            return self.copy(batch)
+        # batch уже нарезан; внутри него bulk_create сам выбирает
+        # размер пачки, допустимый для СУБД (на SQLite он меньше 500)
+        self.model.objects.using(self.using).bulk_create(
+            self.model(**row, **self.extra) for row in batch
+        )
+        return len(batch)
+
+    def copy(self, batch):
+        connection = connections[self.using]
+        quote = connection.ops.quote_name
+        meta = self.model._meta
+        columns = [
+            meta.get_field(field).column
+            for field in (*self.fields, *self.extra)
+        ]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in batch:
+            writer.writerow((*row.values(), *self.extra.values()))
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {quote(meta.db_table)} '
+                f'({", ".join(quote(column) for column in columns)}) '
+                f'FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+        return len(batch)
+
+
+class LoadCommand(BaseCommand):
+    """Общая основа команд загрузки справочников из CSV или JSON."""
+    model = None
+    fields = ()
+    key_fields = ()
+    default_filename = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('filename', default=self.default_filename,
+                            nargs='?', type=str)
+        parser.add_argument('--batch-size', default=1000, type=int)
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Не использовать COPY на PostgreSQL')
+
+    def get_extra(self, options):
+        return {}
+
+    def after_load(self):
+        bump_version(self.model._meta.label_lower)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        loader = BulkLoader(
+            self.model,
+            self.fields,
+            self.key_fields,
+            batch_size=options['batch_size'],
+            use_copy=not options['no_copy'],
+            extra=self.get_extra(options)
+        )
+        started = time.monotonic()
+        read, inserted = loader.load(
+            iter_file_rows(options['filename'], self.fields)
+        )
+        if inserted:
+            self.after_load()
+            warn_if_cache_is_local(self)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {read}, добавлено {inserted} за {elapsed:.2f} с '
+            f'({read / elapsed if elapsed else read:.0f} строк/с)'
+        ))
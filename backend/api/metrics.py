@@ -0,0 +1,262 @@
+import hmac
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Histogram:
+    """
+    Гистограмма по образцу HdrHistogram: корзины растут степенями двойки
+    и делятся на 2 ** precision равных частей, так что относительная
+    ошибка не больше 2 ** -precision при любом разбросе значений.
+    """
+
+    def __init__(self, precision=5):
+        self.precision = precision
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def bucket(self, value):
+        shift = value.bit_length() - self.precision - 1
+        if shift <= 0:
+            return value
+        return value >> shift << shift
+
+    def record(self, value):
+        value = max(int(value), 0)
+        bucket = self.bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def upper_bound(self, bucket):
+        shift = bucket.bit_length() - self.precision - 1
+        return bucket if shift <= 0 else bucket + (1 << shift) - 1
+
+    def quantile(self, quantile):
+        if not self.count:
+            return 0
+        rank = quantile * self.count
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(self.upper_bound(bucket), self.max)
+        return self.max
+
+
+class Metric:
+    def __init__(self, name, help_text, scale=1):
+        self.name = name
+        self.help_text = help_text
+        self.scale = scale
+        self.histograms = {}
+
+
+class Registry:
+    """Метрики процесса: у каждого воркера gunicorn свои."""
+    prefix = 'foodgram_'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.metrics = {
+            name: Metric(name, help_text, scale)
+            for name, help_text, scale in (
+                ('request_duration_seconds',
+                 'Время обработки запроса', 1e-6),
+                ('view_duration_seconds',
+                 'Время работы view до рендеринга ответа', 1e-6),
+                ('serialize_duration_seconds',
+                 'Время сериализаторов DRF внутри view', 1e-6),
+                ('render_duration_seconds',
+                 'Время рендеринга готовых данных ответа в байты', 1e-6),
+                ('db_queries', 'Число SQL-запросов на запрос', 1),
+                ('db_duration_seconds', 'Время SQL-запросов', 1e-6),
+                ('response_size_bytes', 'Размер тела ответа', 1),
+            )
+        }
+
+    def observe(self, labels, status, values):
+        with self.lock:
+            key = (*labels, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for name, value in values.items():
+                self.metrics[name].histograms.setdefault(
+                    labels, Histogram()
+                ).record(value)
+
+    def reset(self):
+        with self.lock:
+            self.requests.clear()
+            for metric in self.metrics.values():
+                metric.histograms.clear()
+
+    def render(self):
+        lines = [
+            f'# HELP {self.prefix}http_requests_total Число запросов',
+            f'# TYPE {self.prefix}http_requests_total counter',
+        ]
+        with self.lock:
+            for (route, method, status), count in sorted(
+                    self.requests.items()
+            ):
+                lines.append(
+                    f'{self.prefix}http_requests_total{{route="{route}",'
+                    f'method="{method}",status="{status}"}} {count}'
+                )
+            for metric in self.metrics.values():
+                name = f'{self.prefix}{metric.name}'
+                lines.append(f'# HELP {name} {metric.help_text}')
+                lines.append(f'# TYPE {name} summary')
+                for (route, method), histogram in sorted(
+                        metric.histograms.items()
+                ):
+                    labels = f'route="{route}",method="{method}"'
+                    for quantile in QUANTILES:
+                        value = histogram.quantile(quantile) * metric.scale
+                        lines.append(
+                            f'{name}{{{labels},quantile="{quantile}"}} '
+                            f'{value:g}'
+                        )
+                    lines.append(
+                        f'{name}_sum{{{labels}}} '
+                        f'{histogram.total * metric.scale:g}'
+                    )
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def route_name(request, view_func):
+    """viewset.action для DRF, имя url для остальных view."""
+    initkwargs = getattr(view_func, 'initkwargs', None)
+    actions = getattr(view_func, 'actions', None)
+    if initkwargs is not None and actions:
+        basename = initkwargs.get('basename') or view_func.cls.__name__
+        action = actions.get(request.method.lower(), request.method.lower())
+        return f'{basename}.{action}'
+    match = request.resolver_match
+    return match.view_name if match and match.view_name else 'unnamed'
+
+
+class QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class TimedRepresentationMixin:
+    """
+    Добавляет время to_representation к метрике сериализации запроса.
+    Вложенные сериализаторы уже входят во время внешнего.
+    """
+
+    def to_representation(self, instance):
+        request = self.context.get('request')
+        metrics = getattr(
+            getattr(request, '_request', request), '_metrics', None
+        )
+        if metrics is None or metrics.get('serializing'):
+            return super().to_representation(instance)
+        metrics['serializing'] = True
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics['serializing'] = False
+            metrics['serialize'] = (
+                metrics.get('serialize', 0) + time.perf_counter() - started
+            )
+
+
+class MetricsMiddleware:
+    """
+    Собирает по каждому маршруту время запроса, view, сериализации
+    (часть времени view, см. TimedRepresentationMixin) и рендеринга,
+    число и время SQL-запросов и размер ответа.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._metrics = {'route': 'unmatched'}
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        finished = time.perf_counter()
+        metrics = request._metrics
+        values = {
+            'request_duration_seconds': (finished - started) * 1e6,
+            'db_queries': timer.count,
+            'db_duration_seconds': timer.duration * 1e6,
+        }
+        if 'view' in metrics:
+            values['view_duration_seconds'] = (
+                metrics.get('render_started', finished) - metrics['view']
+            ) * 1e6
+        if 'serialize' in metrics:
+            values['serialize_duration_seconds'] = metrics['serialize'] * 1e6
+        if 'render' in metrics:
+            values['render_duration_seconds'] = metrics['render'] * 1e6
+        if not response.streaming:
+            values['response_size_bytes'] = len(response.content)
+        registry.observe(
+            (metrics['route'], request.method), response.status_code, values
+        )
+        if settings.METRICS_QUERY_COUNT_HEADER:
+            response['X-Query-Count'] = str(timer.count)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics['route'] = route_name(request, view_func)
+        request._metrics['view'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        metrics = request._metrics
+        metrics['render_started'] = time.perf_counter()
+
+        def rendered(response):
+            metrics['render'] = (
+                time.perf_counter() - metrics['render_started']
+            )
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def metrics_view(request):
+    """Метрики в текстовом формате Prometheus для персонала или по токену."""
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    allowed = request.user.is_staff or bool(token) and hmac.compare_digest(
+        header.encode(), f'Bearer {token}'.encode()
+    )
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4'
+    )
@@ -1,5 +1,150 @@
-from rest_framework.pagination import PageNumberPagination
+from functools import partial
+from hashlib import md5
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from .cache import bump_version, get_cache, get_versions
+
+RECIPE_COUNT_VERSION = 'recipe-count'
+
+
+def bump_recipe_count_version(user_id=None):
+    if user_id is None:
+        bump_version(RECIPE_COUNT_VERSION)
+    else:
+        bump_version(f'{RECIPE_COUNT_VERSION}:{user_id}')
+
+
+def estimate_count(model):
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE relname = %s',
+            (model._meta.db_table,)
+        )
+        row = cursor.fetchone()
+    return int(row[0]) if row else None
+
+
+class CachedCountPaginator(Paginator):
+    def __init__(self, object_list, per_page, cache_key=None,
+                 estimate=False, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+        self.estimate = estimate
+
+    @cached_property
+    def count(self):
+        cache = get_cache()
+        count = cache.get(self.cache_key)
+        if count is None:
+            count = self.estimate_count()
+            if count is None:
+                count = super().count
+            cache.set(self.cache_key, count, settings.RECIPE_COUNT_CACHE_TTL)
+        return count
+
+    def estimate_count(self):
+        minimum = settings.RECIPE_COUNT_ESTIMATE_MIN
+        if not self.estimate or minimum is None:
+            return None
+        count = estimate_count(self.object_list.model)
+        if count is None or count < minimum:
+            return None
+        return count
+
+
+class KeysetPagination(CursorPagination):
+    ordering = '-id'
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
 
 
 class PagePagination(PageNumberPagination):
+    """
+    Постраничная пагинация; с ?pagination=cursor (или при переданном
+    cursor) переключается на keyset-пагинацию по id без COUNT и OFFSET.
+    """
     page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    keyset_pagination_class = KeysetPagination
+
+    def is_keyset(self, request):
+        return (
+            request.query_params.get('pagination') == 'cursor'
+            or self.keyset_pagination_class.cursor_query_param
+            in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.is_keyset(request):
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class ListPagination(PageNumberPagination):
+    """Постраничная пагинация готового списка, без keyset-режима."""
+    page_size = PagePagination.page_size
+    page_size_query_param = PagePagination.page_size_query_param
+    max_page_size = PagePagination.max_page_size
+
+
+class RecipePagination(PagePagination):
+    """
+    COUNT для ленты рецептов кэшируется по нормализованному набору
+    фильтров; для ленты без фильтров берётся оценка из pg_class.
+    """
+    ignored_query_params = ('page', 'limit', 'pagination', 'cursor', 'format')
+    user_query_params = ('is_favorited', 'is_in_shopping_cart')
+    # сортируют не по id, keyset-пагинация их порядок потеряет
+    ranked_query_params = ('search',)
+
+    def get_count_cache_key(self, request):
+        params = sorted(
+            (key, sorted(set(request.query_params.getlist(key))))
+            for key in request.query_params
+            if key not in self.ignored_query_params
+        )
+        names = [RECIPE_COUNT_VERSION]
+        if request.user.is_authenticated and any(
+            key in self.user_query_params for key, _ in params
+        ):
+            names.append(f'{RECIPE_COUNT_VERSION}:{request.user.id}')
+            params.append(('user', request.user.id))
+        versions = ':'.join(map(str, get_versions(*names)))
+        digest = md5(repr(params).encode()).hexdigest()
+        return params, f'{RECIPE_COUNT_VERSION}:{versions}:{digest}'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ranked = [
+            key for key in self.ranked_query_params
+            if request.query_params.get(key, '').strip()
+        ]
+        if ranked and self.is_keyset(request):
+            raise ValidationError({
+                key: 'Не сочетается с pagination=cursor: результаты '
+                     'упорядочены по релевантности, используйте page.'
+                for key in ranked
+            })
+        params, cache_key = self.get_count_cache_key(request)
+        self.django_paginator_class = partial(
+            CachedCountPaginator,
+            cache_key=cache_key,
+            estimate=not params
+        )
+        return super().paginate_queryset(queryset, request, view)
@@ -0,0 +1,143 @@
+import fcntl
+import hashlib
+import os
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+from .cache import get_cache
+from .images import EXTENSIONS, encode, is_raw
+
+RENDITIONS_DIR = 'renditions'
+
+
+def hash_key(name):
+    return f'image-hash:{name}'
+
+
+def ready_key(digest, rendition):
+    return f'rendition:{digest}:{rendition}'
+
+
+def source_hash(storage, name):
+    """
+    sha256 исходного файла. Имена загруженных файлов не переиспользуются,
+    поэтому хэш кэшируется по имени без срока жизни.
+    """
+    content_hash = getattr(storage, 'content_hash', None)
+    if content_hash is not None and content_hash(name):
+        return content_hash(name)
+    digest = get_cache().get(hash_key(name))
+    if digest is None:
+        sha = hashlib.sha256()
+        try:
+            with storage.open(name, 'rb') as file:
+                for chunk in iter(lambda: file.read(64 * 1024), b''):
+                    sha.update(chunk)
+        except FileNotFoundError:
+            return None
+        digest = sha.hexdigest()
+        get_cache().set(hash_key(name), digest, None)
+    return digest
+
+
+def rendition_name(digest, rendition):
+    extension = EXTENSIONS[settings.IMAGE_FORMAT.upper()]
+    return f'{RENDITIONS_DIR}/{digest[:2]}/{digest}_{rendition}.{extension}'
+
+
+@contextmanager
+def file_lock(storage, name):
+    """Межпроцессная блокировка на время генерации файла name."""
+    try:
+        path = storage.path(
+            f'{RENDITIONS_DIR}/locks/{os.path.basename(name)}'
+        )
+    except NotImplementedError:
+        yield
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def render(image, rendition):
+    width, height, crop = settings.IMAGE_RENDITIONS[rendition]
+    if crop:
+        return ImageOps.fit(
+            image, (width, height), Image.Resampling.LANCZOS
+        )
+    image = image.copy()
+    image.thumbnail((width, height), Image.Resampling.LANCZOS)
+    return image
+
+
+def generate_renditions(image_file, renditions=None):
+    """
+    Создаёт недостающие размеры картинки image_file (FieldFile).
+    Возвращает словарь {размер: имя файла} только для созданных сейчас.
+    """
+    storage = image_file.storage
+    digest = source_hash(storage, image_file.name)
+    if digest is None:
+        return {}
+    created = {}
+    image = None
+    for rendition in renditions or settings.IMAGE_RENDITIONS:
+        name = rendition_name(digest, rendition)
+        with file_lock(storage, name):
+            if not storage.exists(name):
+                if image is None:
+                    with storage.open(image_file.name, 'rb') as file:
+                        image = Image.open(file)
+                        image.load()
+                    image = ImageOps.exif_transpose(image)
+                created[rendition] = storage.save(
+                    name,
+                    encode(
+                        render(image, rendition),
+                        settings.IMAGE_FORMAT.upper()
+                    )
+                )
+        get_cache().set(ready_key(digest, rendition), True, None)
+    return created
+
+
+def rendition_urls(recipe, request=None):
+    """
+    Ссылки на размеры картинки рецепта. Для ещё не созданных размеров
+    отдаётся адрес, по которому размер будет создан при первом запросе.
+    Необработанная загрузка размеров не имеет.
+    """
+    if not recipe.image or is_raw(recipe.image.name):
+        return {}
+    storage = recipe.image.storage
+    digest = source_hash(storage, recipe.image.name)
+    if digest is None:
+        return {}
+    ready = get_cache().get_many([
+        ready_key(digest, rendition)
+        for rendition in settings.IMAGE_RENDITIONS
+    ])
+    urls = {}
+    for rendition in settings.IMAGE_RENDITIONS:
+        name = rendition_name(digest, rendition)
+        key = ready_key(digest, rendition)
+        if key not in ready and storage.exists(name):
+            get_cache().set(key, True, None)
+            ready[key] = True
+        if key in ready:
+            url = storage.url(name)
+        else:
+            url = reverse(
+                'recipes-image',
+                kwargs={'pk': recipe.id, 'rendition': rendition}
+            )
+        urls[rendition] = request.build_absolute_uri(url) if request else url
+    return urls
@@ -1,24 +1,31 @@
 from string import hexdigits
 
 from django.contrib.auth.hashers import make_password
-from drf_extra_fields.fields import Base64ImageField
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.validators import UniqueTogetherValidator
 
+from .images import RawBase64ImageField, schedule_image_processing
+from .metrics import TimedRepresentationMixin
+from .renditions import rendition_urls
 from recipes.models import (
     Tag,
     Ingredient,
     Recipe,
     Favourite,
     Cart,
+    CartIngredientTotal,
     IngredientAmount,
     User,
     Follow
 )
+from recipes.signals import recipe_ingredients_changed
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(
+        TimedRepresentationMixin, serializers.ModelSerializer
+):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -38,6 +45,8 @@ class UserSerializer(serializers.ModelSerializer):
         return make_password(value)
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -66,7 +75,9 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(
+        TimedRepresentationMixin, serializers.ModelSerializer
+):
     class Meta:
         model = Tag
         fields = ('id', 'name', 'color', 'slug',)
@@ -84,22 +95,60 @@ class TagSerializer(serializers.ModelSerializer):
         return f'#{color}'
 
 
-class IngredientsSerializer(serializers.ModelSerializer):
+class IngredientsSerializer(
+        TimedRepresentationMixin, serializers.ModelSerializer
+):
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
         read_only_fields = ('__all__',)
 
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class BatchSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+
+
+class IngredientSetSerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+
+
+class RecipesLimitSerializer(serializers.Serializer):
+    recipes_limit = serializers.IntegerField(min_value=0, required=False)
+
+
+class ImageRenditionsMixin(serializers.Serializer):
+    image_renditions = serializers.SerializerMethodField()
+
+    def get_image_renditions(self, obj):
+        return rendition_urls(obj, self.context.get('request'))
+
+
+class ShortRecipeSerializer(
+        TimedRepresentationMixin,
+        ImageRenditionsMixin,
+        serializers.ModelSerializer
+):
     class Meta:
         model = Recipe
-        fields = 'id', 'name', 'image', 'cooking_time'
+        fields = 'id', 'name', 'image', 'image_renditions', 'cooking_time'
         read_only_fields = '__all__',
 
 
-class RecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+class RecipeSerializer(
+        TimedRepresentationMixin,
+        ImageRenditionsMixin,
+        serializers.ModelSerializer
+):
+    image = RawBase64ImageField()
     author = UserSerializer(
         read_only=True
     )
@@ -124,11 +173,25 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_renditions',
             'text',
             'cooking_time'
         )
 
-    def get_is(self, obj, model):
+    def to_representation(self, recipe):
+        if hasattr(recipe, 'author_is_subscribed'):
+            recipe.author.is_subscribed = recipe.author_is_subscribed
+        return super().to_representation(recipe)
+
+    def validate_ingredients(self, ingredients):
+        ids = [ingredient['ingredient']['id'].id for ingredient in ingredients]
+        if len(ids) != len(set(ids)):
+            raise ValidationError('Ингредиенты не должны повторяться.')
+        return ingredients
+
+    def get_is(self, obj, model, annotation):
+        if hasattr(obj, annotation):
+            return getattr(obj, annotation)
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -137,38 +200,64 @@ class RecipeSerializer(serializers.ModelSerializer):
         ).exists()
 
     def get_is_favorited(self, obj):
-        return self.get_is(obj, Favourite)
+        return self.get_is(obj, Favourite, 'is_favorited')
 
     def get_is_in_shopping_cart(self, obj):
-        return self.get_is(obj, Cart)
-
-    def add_ingredient(self, ingredients, recipe):
-        for ingredient in ingredients:
-            IngredientAmount.objects.create(
+        return self.get_is(obj, Cart, 'is_in_shopping_cart')
+
+    def set_ingredients(self, ingredients, recipe):
+        amounts = {
+            ingredient['ingredient']['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = []
+        changed = []
+        for ingredient_amount in IngredientAmount.objects.filter(
+                recipe=recipe
+        ):
+            amount = amounts.pop(ingredient_amount.ingredient_id, None)
+            if amount is None:
+                removed.append(ingredient_amount.id)
+            elif amount != ingredient_amount.amount:
+                ingredient_amount.amount = amount
+                changed.append(ingredient_amount)
+        if removed:
+            IngredientAmount.objects.filter(id__in=removed).delete()
+        if changed:
+            IngredientAmount.objects.bulk_update(changed, ('amount',))
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
                 recipe=recipe,
-                ingredient_id=ingredient.get('id'),
-                amount=ingredient.get('amount')
+                ingredient_id=ingredient_id,
+                amount=amount
             )
+            for ingredient_id, amount in amounts.items()
+        )
 
+    @transaction.atomic
     def create(self, validated_data):
         image = validated_data.pop('image')
         tags = self.initial_data.get('tags')
-        ingredients_data = self.context.get('request').data.get('ingredients')
-        validated_data.pop('ingredients')
+        ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(
             image=image,
             **validated_data
         )
         recipe.tags.set(tags)
-        self.add_ingredient(
-            ingredients_data,
+        self.set_ingredients(
+            ingredients,
             recipe
         )
+        recipe_ingredients_changed.send(
+            sender=Recipe, recipe_ids=(recipe.id,)
+        )
+        schedule_image_processing(recipe.id)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
         tags = self.initial_data.get('tags')
-        ingredients_data = self.context.get('request').data.get('ingredients')
+        ingredients = validated_data.get('ingredients')
         recipe.image = validated_data.get(
             'image',
             recipe.image
@@ -187,16 +276,23 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
         if tags:
-            #recipe.tags.clear()
             recipe.tags.set(tags)
 
-        if ingredients_data:
-            recipe.ingredient.clear()
-            self.add_ingredient(
-                ingredients_data,
+        if ingredients is not None:
+            carts = list(recipe.carts.values_list('user_id', flat=True))
+            CartIngredientTotal.objects.remove_recipes(carts, (recipe.id,))
+            self.set_ingredients(
+                ingredients,
                 recipe
             )
+            CartIngredientTotal.objects.add_recipes(carts, (recipe.id,))
         recipe.save()
+        if ingredients is not None:
+            recipe_ingredients_changed.send(
+                sender=Recipe, recipe_ids=(recipe.id,)
+            )
+        if 'image' in validated_data:
+            schedule_image_processing(recipe.id)
         return recipe
 
 
@@ -217,7 +313,9 @@ class FavouriteSerializer(serializers.ModelSerializer):
         model = Favourite
 
 
-class FollowSerializer(serializers.ModelSerializer):
+class FollowSerializer(
+        TimedRepresentationMixin, serializers.ModelSerializer
+):
     id = serializers.ReadOnlyField(source='author.id')
     email = serializers.ReadOnlyField(source='author.email')
     username = serializers.ReadOnlyField(source='author.username')
@@ -245,12 +343,15 @@ class FollowSerializer(serializers.ModelSerializer):
         ]
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return Recipe.objects.filter(author=obj.author).count()
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
+        if hasattr(obj, 'author_recipes'):
+            return ShortRecipeSerializer(obj.author_recipes, many=True).data
+        limit = self.context.get('recipes_limit')
         queryset = Recipe.objects.filter(author=obj.author)
-        if limit:
-            queryset = queryset[:int(limit)]
+        if limit is not None:
+            queryset = queryset[:limit]
         return ShortRecipeSerializer(queryset, many=True).data
@@ -0,0 +1,141 @@
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from recipes.models import (
+    Cart,
+    CartIngredientTotal,
+    Ingredient,
+    Recipe,
+    Tag,
+    User
+)
+from recipes.signals import recipe_ingredients_changed
+from .cache import bump_version
+from .feed import bump_recipe_versions, invalidate_user_overlay
+from .indexes import ingredient_index, recipe_ingredient_index, tag_index
+from .pagination import bump_recipe_count_version
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_delete, sender=Ingredient)
+def invalidate_recipe_ingredient_index(**kwargs):
+    # строки IngredientAmount удалены каскадом без сигналов
+    transaction.on_commit(recipe_ingredient_index.invalidate)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_cached_responses(sender, **kwargs):
+    bump_version(sender._meta.label_lower)
+
+
+def invalidate_user_cart_caches(user_id):
+    transaction.on_commit(lambda: invalidate_user_overlay(user_id))
+    transaction.on_commit(lambda: bump_recipe_count_version(user_id))
+
+
+@receiver(post_save, sender=Cart)
+def add_cart_to_totals(instance, created, **kwargs):
+    # INSERT из Cart.objects.add сигналов не шлёт, там итоги правят сами
+    if created:
+        CartIngredientTotal.objects.add_recipes(
+            (instance.user_id,), (instance.recipe_id,)
+        )
+        invalidate_user_cart_caches(instance.user_id)
+
+
+@receiver(pre_delete, sender=Cart)
+def remove_cart_from_totals(instance, **kwargs):
+    # pre_delete: при каскадном удалении рецепта его ингредиенты ещё есть
+    CartIngredientTotal.objects.remove_recipes(
+        (instance.user_id,), (instance.recipe_id,)
+    )
+    invalidate_user_cart_caches(instance.user_id)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_counts(**kwargs):
+    bump_recipe_count_version()
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_recipe_body(instance, **kwargs):
+    bump_recipe_versions((instance.id,))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_body_tags(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_recipe_versions((instance.id,))
+    elif pk_set:
+        bump_recipe_versions(pk_set)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_recipe_bodies(instance, update_fields, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login', 'password'}:
+        return
+    bump_recipe_versions(instance.recipes.values_list('id', flat=True))
+
+
+@receiver((post_save, pre_delete), sender=Tag)
+@receiver((post_save, pre_delete), sender=Ingredient)
+def invalidate_related_recipe_bodies(instance, **kwargs):
+    # при удалении связи уходят каскадом, id рецептов собираем до него
+    bump_recipe_versions(instance.recipes.values_list('id', flat=True))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def update_recipe_search_vector(instance, **kwargs):
+    Recipe.objects.update_search_vectors((instance.id,))
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_search_vectors(instance, created, **kwargs):
+    if not created:
+        Recipe.objects.update_search_vectors(
+            instance.recipes.values_list('id', flat=True)
+        )
+
+
+@receiver(recipe_ingredients_changed)
+def update_recipe_ingredients(recipe_ids, **kwargs):
+    Recipe.objects.update_search_vectors(recipe_ids)
+    # индексы других процессов перестроятся, только когда данные видны
+    transaction.on_commit(
+        lambda: recipe_ingredient_index.update(recipe_ids)
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_indexes(instance, **kwargs):
+    recipe_ids = (instance.id,)
+    transaction.on_commit(lambda: recipe_ingredient_index.update(recipe_ids))
+    transaction.on_commit(lambda: tag_index.update(recipe_ids))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_tag_index(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # со стороны тега: post_clear не передаёт id рецептов
+        transaction.on_commit(tag_index.invalidate)
+    else:
+        recipe_id = instance.id
+        transaction.on_commit(lambda: tag_index.update((recipe_id,)))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_index(**kwargs):
+    transaction.on_commit(tag_index.invalidate)
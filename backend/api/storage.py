@@ -0,0 +1,105 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+RAW_PREFIX = 'raw_'
+CONTENT_NAME = re.compile(rf'^(?:{RAW_PREFIX})?([0-9a-f]{{64}})\.\w+$')
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+# расширение файлов, формат которых не распознан по сигнатуре
+UNKNOWN_EXTENSION = 'bin'
+
+
+def sniff_extension(data):
+    """Расширение файла по сигнатуре или None."""
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    for signature, extension in SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    return None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файлы из content_addressed_dirs называются по sha256 содержимого,
+    поэтому одинаковые загрузки хранятся одним файлом. Такие файлы
+    не удаляются при замене картинки: их убирает команда gc_media.
+    """
+    content_addressed_dirs = ('recipes',)
+
+    def content_dir(self, name):
+        top = name.replace('\\', '/').split('/', 1)[0]
+        return top if top in self.content_addressed_dirs else None
+
+    def content_hash(self, name):
+        """sha256 файла, если он хранится под своим хэшем."""
+        match = CONTENT_NAME.match(posixpath.basename(name))
+        return match.group(1) if match else None
+
+    def content_name(self, name, content):
+        """
+        Имя по sha256 содержимого; расширение берётся из сигнатуры
+        файла, а не из имени, которое прислал клиент.
+        """
+        sha = hashlib.sha256()
+        header = b''
+        for chunk in content.chunks():
+            if not header:
+                header = chunk[:16]
+            sha.update(chunk)
+        digest = sha.hexdigest()
+        extension = sniff_extension(header) or UNKNOWN_EXTENSION
+        stem = posixpath.basename(name)
+        prefix = RAW_PREFIX if stem.startswith(RAW_PREFIX) else ''
+        return posixpath.join(
+            self.content_dir(name),
+            digest[:2],
+            f'{prefix}{digest}.{extension}'
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        if self.content_dir(name):
+            name = self.content_name(name, content)
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        if self.content_dir(name):
+            return name
+        return super().get_available_name(name, max_length=max_length)
+
+    def _save(self, name, content):
+        if not self.content_dir(name):
+            return super()._save(name, content)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            # свежий mtime не даст gc_media удалить файл до коммита
+            os.utime(full_path)
+            return name
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            os.chmod(temporary, self.file_permissions_mode or 0o644)
+            os.replace(temporary, full_path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return name
@@ -0,0 +1,8 @@
+from celery import shared_task
+
+from .images import process_recipe_image
+
+
+@shared_task(ignore_result=True)
+def process_recipe_image_task(recipe_id):
+    process_recipe_image(recipe_id)
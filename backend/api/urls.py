@@ -1,6 +1,7 @@
 from rest_framework.routers import SimpleRouter
 from django.urls import path, include
 
+from .metrics import metrics_view
 from .views import (
     TagViewSet,
     IngredientsViewSet,
@@ -32,6 +33,7 @@ router_v1.register(
 
 
 urlpatterns = [
+    path('metrics/', metrics_view, name='metrics'),
     path('', include(router_v1.urls)),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
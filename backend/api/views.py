@@ -1,45 +1,101 @@
 from urllib.parse import unquote
 
-from django.db.models import F, Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.db.models import (
+    BooleanField, Count, Exists, F, OuterRef, Prefetch, Value
+)
+from django.http import Http404, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.serializers import SetPasswordSerializer
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from .cache import CachedResponseMixin
+from .exporters import EXPORTERS
+from .feed import (
+    apply_overlay,
+    bump_recipe_versions,
+    get_recipe_bodies,
+    get_user_overlay,
+    invalidate_user_overlay
+)
 from .filters import RecipeFilter
-from .pagination import PagePagination
+from .indexes import (
+    bitset_size,
+    ingredient_index,
+    recipe_ingredient_index,
+    tag_index
+)
+from .pagination import (
+    ListPagination,
+    PagePagination,
+    RecipePagination,
+    bump_recipe_count_version
+)
 from .permissions import IsAdminOrAuthorOrReadOnly, AdminOrReadOnly
+from .renditions import generate_renditions, rendition_name, source_hash
 from recipes.models import (
     Tag,
     Ingredient,
     Recipe,
     Cart,
+    CartIngredientTotal,
     Favourite,
     IngredientAmount,
     Follow,
     User
 )
 from .serializers import (
+    BatchSerializer,
     UserSerializer,
     TagSerializer,
     IngredientsSerializer,
     RecipeSerializer,
     FollowSerializer,
+    IngredientSetSerializer,
+    RecipesLimitSerializer,
     ShortRecipeSerializer
 )
 
 
-class TagViewSet(viewsets.ModelViewSet):
+def add_links(request, model, queryset):
+    """
+    Добавляет пользователю связи с объектами из request.data['ids']:
+    один запрос на проверку id и один INSERT на все новые связи.
+    Возвращает id добавленных объектов и статус по каждому id.
+    """
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = list(dict.fromkeys(serializer.validated_data['ids']))
+    found = set(queryset.filter(id__in=ids).values_list('id', flat=True))
+    created = model.objects.add(
+        request.user, [pk for pk in ids if pk in found]
+    )
+    results = []
+    for pk in ids:
+        if pk in created:
+            result = 'created'
+        elif pk in found:
+            result = 'exists'
+        else:
+            result = 'not_found'
+        results.append({'id': pk, 'status': result})
+    return created, results
+
+
+class TagViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     permission_classes = (AdminOrReadOnly,)
     serializer_class = TagSerializer
 
 
-class IngredientsViewSet(viewsets.ModelViewSet):
+class IngredientsViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientsSerializer
     permission_classes = (AdminOrReadOnly,)
@@ -50,38 +106,56 @@ class IngredientsViewSet(viewsets.ModelViewSet):
             'йцукенгшщзхъфывапролджэячсмитьбю.'
         )
         name = self.request.query_params.get('name')
-        queryset = self.queryset
+        queryset = self.queryset.all()
         if name:
             if name[0] == '%':
                 name = unquote(name)
             else:
                 name = name.translate(layout)
-            name = name.lower()
-            stw_queryset = list(queryset.filter(name__startswith=name))
-            cnt_queryset = queryset.filter(name__contains=name)
-            stw_queryset.extend(
-                [i for i in cnt_queryset if i not in stw_queryset]
-            )
-            queryset = stw_queryset
+            queryset = ingredient_index.search(name)
         return queryset
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
+    # search_vector нужен только фильтру ?search=, читать его незачем
+    queryset = Recipe.objects.defer('search_vector').select_related(
+        'author'
+    ).prefetch_related(
+        'tags',
+        Prefetch(
+            'ingredients',
+            queryset=IngredientAmount.objects.select_related('ingredient')
+        ),
+    )
     serializer_class = RecipeSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (IsAdminOrAuthorOrReadOnly,)
-    pagination_class = PagePagination
+    pagination_class = RecipePagination
 
     def get_queryset(self):
-        is_f = self.request.query_params.get('is_favorited')
-        if is_f is not None and int(is_f) == 1:
-            return Recipe.objects.filter(favourites__user=self.request.user)
-        is_c = self.request.query_params.get('is_in_shopping_cart')
-        if is_c is not None and int(is_c) == 1:
-            return Recipe.objects.filter(carts__user=self.request.user)
-        return Recipe.objects.all()
+        return super().get_queryset().with_user_flags(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(
+            self.get_queryset()
+        ).prefetch_related(None).values('id')
+        page = self.paginate_queryset(queryset)
+        overlay = get_user_overlay(request.user)
+        return self.get_paginated_response([
+            apply_overlay(recipe, overlay)
+            for recipe in get_recipe_bodies(
+                [row['id'] for row in page], request, self.serialize_bodies
+            )
+        ])
+
+    def serialize_bodies(self, recipe_ids):
+        return self.get_serializer(
+            self.queryset.with_user_flags(
+                AnonymousUser()
+            ).filter(id__in=recipe_ids),
+            many=True
+        ).data
 
     @property
     def get_user(self):
@@ -116,55 +190,191 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return self.del_obj(Favourite, pk)
         return None
 
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart',
+        url_name='shopping_cart_batch'
+    )
+    def shopping_cart_batch(self, request):
+        return self.add_batch(Cart)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=(IsAuthenticated,),
+        url_path='favorite',
+        url_name='favorite_batch'
+    )
+    def favorite_batch(self, request):
+        return self.add_batch(Favourite)
+
+    def add_batch(self, model):
+        with transaction.atomic():
+            created, results = add_links(
+                self.request, model, Recipe.objects.all()
+            )
+            if created and model is Cart:
+                CartIngredientTotal.objects.add_recipes(
+                    (self.get_user.id,), created
+                )
+        if created:
+            bump_recipe_count_version(self.get_user.id)
+            invalidate_user_overlay(self.get_user.id)
+        return Response(results, status=status.HTTP_200_OK)
+
     def add_obj(self, model, pk):
-        if model.objects.filter(
-                user=self.get_user,
-                id=pk
-        ).exists():
-            return Response('Уже существует', status=status.HTTP_400_BAD_REQUEST)
-        recipe = get_object_or_404(Recipe, id=pk)
-        model.objects.create(
-            user=self.get_user,
-            recipe=recipe
+        recipe = get_object_or_404(
+            Recipe.objects.defer('search_vector'), id=pk
         )
+        with transaction.atomic():
+            if not model.objects.add(self.get_user, (recipe.id,)):
+                return Response(
+                    'Уже существует', status=status.HTTP_400_BAD_REQUEST
+                )
+            if model is Cart:
+                CartIngredientTotal.objects.add_recipes(
+                    (self.get_user.id,), (recipe.id,)
+                )
+        bump_recipe_count_version(self.get_user.id)
+        invalidate_user_overlay(self.get_user.id)
         serializer = ShortRecipeSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def del_obj(self, model, pk):
-        obj = model.objects.filter(
-            user=self.get_user,
-            recipe__id=pk
+        with transaction.atomic():
+            # итоги корзины при удалении правит сигнал pre_delete
+            if not model.objects.remove(self.get_user, (pk,)):
+                return Response(
+                    'Не существует', status=status.HTTP_400_BAD_REQUEST
+                )
+        bump_recipe_count_version(self.get_user.id)
+        invalidate_user_overlay(self.get_user.id)
+        return Response('', status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        methods=('get',),
+        detail=True,
+        url_path=r'image/(?P<rendition>\w+)',
+        url_name='image'
+    )
+    def image(self, request, pk=None, rendition=None):
+        recipe = get_object_or_404(Recipe.objects.only('id', 'image'), id=pk)
+        if rendition not in settings.IMAGE_RENDITIONS or not recipe.image:
+            raise Http404
+        if generate_renditions(recipe.image, (rendition,)):
+            bump_recipe_versions((recipe.id,))
+        digest = source_hash(recipe.image.storage, recipe.image.name)
+        if digest is None:
+            raise Http404
+        return HttpResponseRedirect(
+            recipe.image.storage.url(rendition_name(digest, rendition))
         )
-        if not obj.exists():
-            return Response(
-                'Не существует', status=status.HTTP_400_BAD_REQUEST
+
+    @action(
+        methods=('get',),
+        detail=False,
+        url_path='tag_counts',
+        url_name='tag_counts'
+    )
+    def tag_counts(self, request):
+        """
+        Число рецептов с каждым тегом среди отобранных ?tags=
+        и ?tags_mode= (без отбора — среди всех рецептов с тегами),
+        из индекса в памяти.
+        """
+        form = RecipeFilter(
+            request.query_params, queryset=Recipe.objects.none()
+        ).form
+        if not form.is_valid():
+            raise ValidationError(form.errors)
+        slugs = form.cleaned_data.get('tags')
+        if slugs:
+            selected = tag_index.filter(
+                slugs, form.cleaned_data.get('tags_mode') == 'and'
             )
-        obj.delete()
-        return Response('', status=status.HTTP_204_NO_CONTENT)
+        else:
+            selected = tag_index.filter(tag_index.slugs())
+        return Response({
+            'count': bitset_size(selected),
+            'tags': tag_index.counts(selected),
+        })
 
     @action(
         methods=('get',),
         detail=False,
-        permission_classes=(IsAuthenticated,)
+        url_path='by_ingredients',
+        url_name='by_ingredients'
+    )
+    def by_ingredients(self, request):
+        """
+        Что приготовить из имеющихся ингредиентов (?ingredients=1,2,3):
+        рецепты по убыванию доли имеющихся ингредиентов и по числу
+        недостающих, с необязательным ограничением ?max_missing=.
+        """
+        data = {'ingredients': [
+            value
+            for values in request.query_params.getlist('ingredients')
+            for value in values.split(',') if value
+        ]}
+        if 'max_missing' in request.query_params:
+            data['max_missing'] = request.query_params['max_missing']
+        serializer = IngredientSetSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        ingredient_ids = set(serializer.validated_data['ingredients'])
+        paginator = ListPagination()
+        page = paginator.paginate_queryset(
+            recipe_ingredient_index.search(
+                ingredient_ids, serializer.validated_data.get('max_missing')
+            ),
+            request,
+            view=self
+        )
+        bodies = {
+            body['id']: body
+            for body in get_recipe_bodies(
+                [match.recipe_id for match in page],
+                request,
+                self.serialize_bodies
+            )
+        }
+        overlay = get_user_overlay(request.user)
+        results = []
+        for match in page:
+            if match.recipe_id not in bodies:
+                continue
+            recipe = apply_overlay(bodies[match.recipe_id], overlay)
+            recipe['coverage'] = round(match.coverage, 3)
+            recipe['missing'] = match.missing
+            recipe['missing_ingredients'] = [
+                ingredient_id for ingredient_id in match.ingredients
+                if ingredient_id not in ingredient_ids
+            ]
+            results.append(recipe)
+        return paginator.get_paginated_response(results)
+
+    @action(
+        methods=('get',),
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=tuple(EXPORTERS.values())
     )
     def download_shopping_cart(self, request):
         if not self.get_user.carts.exists():
             return Response('Корзина пуста', status=status.HTTP_400_BAD_REQUEST)
-        name = f'{self.get_user}_shopping_list'
-        ingredients = IngredientAmount.objects.filter(
-            recipe__carts__user=self.get_user
+        exporter = request.accepted_renderer
+        name = f'{self.get_user}_shopping_list.{exporter.extension}'
+        ingredients = CartIngredientTotal.objects.filter(
+            user=self.get_user
         ).values(
-            ingredient_in=F('ingredient__name'),
-            measure=F('ingredient__measurement_unit')
-        ).annotate(amount=Sum('amount'))
-        shopping_list = (f'Список покупок:{self.get_user}`a\n',)
-        for ing in ingredients:
-            shopping_list += (
-                f'{ing["ingredient_in"]}: {ing["amount"]} {ing["measure"]}\n',
-            )
-        response = HttpResponse(
-            shopping_list,
-            content_type='text.txt; charset=utf-8'
+            'amount',
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit')
+        ).order_by('name').iterator()
+        response = StreamingHttpResponse(
+            exporter.stream(f'Список покупок: {self.get_user}', ingredients),
+            content_type=f'{exporter.media_type}; charset={exporter.charset}'
         )
         response['Content-Disposition'] = f'attachment; filename={name}'
         return response
@@ -177,17 +387,30 @@ class UserViewSet(viewsets.ModelViewSet):
     lookup_field = 'id'
 
     def get_queryset(self):
+        user = self.request.user
+        if user.is_anonymous:
+            return User.objects.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+        queryset = User.objects.annotate(
+            is_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('pk')
+            ))
+        )
         is_s = self.request.query_params.get('is_subscribed')
         if is_s is not None and int(is_s) == 1:
-            return User.objects.filter(
-                follower__user=self.request.user
-            )
-        return User.objects.all()
+            return queryset.filter(is_subscribed=True)
+        return queryset
 
     @property
     def get_user(self):
         return self.request.user
 
+    def get_recipes_limit(self):
+        serializer = RecipesLimitSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data.get('recipes_limit')
+
     @action(
         methods=['get', 'patch'],
         detail=False,
@@ -214,9 +437,21 @@ class UserViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def subscriptions(self, request):
+        limit = self.get_recipes_limit()
         pages = self.paginate_queryset(
-            Follow.objects.filter(user=self.get_user)
+            Follow.objects.filter(
+                user=self.get_user
+            ).select_related('author').annotate(
+                recipes_count=Count('author__recipes')
+            ).order_by('-id')
         )
+        author_recipes = {}
+        for recipe in Recipe.objects.latest_per_author(
+                [follow.author_id for follow in pages], limit
+        ):
+            author_recipes.setdefault(recipe.author_id, []).append(recipe)
+        for follow in pages:
+            follow.author_recipes = author_recipes.get(follow.author_id, [])
         serializer = FollowSerializer(
             pages,
             many=True,
@@ -230,6 +465,7 @@ class UserViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def subscribe(self, request, id=None):
+        limit = self.get_recipes_limit()
         author = get_object_or_404(User, id=id)
         if self.get_user == author:
             return Response(
@@ -248,6 +484,7 @@ class UserViewSet(viewsets.ModelViewSet):
                 user=self.get_user,
                 author=author
             ).delete()
+            invalidate_user_overlay(self.get_user.id)
             return Response(status=status.HTTP_204_NO_CONTENT)
         if Follow.objects.filter(
                 user=self.get_user,
@@ -262,10 +499,26 @@ class UserViewSet(viewsets.ModelViewSet):
                 user=self.get_user,
                 author=author
             ),
-            context={'request': request}
+            context={'request': request, 'recipes_limit': limit}
         )
+        invalidate_user_overlay(self.get_user.id)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=(IsAuthenticated,),
+        url_path='subscribe',
+        url_name='subscribe_batch'
+    )
+    def subscribe_batch(self, request):
+        created, results = add_links(
+            request, Follow, User.objects.exclude(id=self.get_user.id)
+        )
+        if created:
+            invalidate_user_overlay(self.get_user.id)
+        return Response(results, status=status.HTTP_200_OK)
+
     @action(
         methods=('post',),
         detail=False,
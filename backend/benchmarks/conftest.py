@@ -0,0 +1,98 @@
+import statistics
+import time
+
+import pytest
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from benchmarks.datagen import generate
+from recipes.models import User
+
+RESULTS = []
+
+
+class Benchmark:
+    """
+    Упрощённая замена фикстуры benchmark из pytest-benchmark, когда
+    плагин не установлен: тот же вызов benchmark(func) и pedantic().
+    """
+
+    def __init__(self, name, rounds=20):
+        self.name = name
+        self.rounds = rounds
+        self.extra_info = {}
+
+    def __call__(self, func, *args, **kwargs):
+        func(*args, **kwargs)
+        return self.pedantic(func, args, kwargs, rounds=self.rounds)
+
+    def pedantic(self, target, args=(), kwargs=None, setup=None, rounds=1,
+                 iterations=1, warmup_rounds=0):
+        kwargs = kwargs or {}
+        for _ in range(warmup_rounds):
+            target(*args, **kwargs)
+        timings = []
+        for _ in range(rounds):
+            if setup is not None:
+                setup()
+            started = time.perf_counter()
+            for _ in range(iterations):
+                result = target(*args, **kwargs)
+            timings.append((time.perf_counter() - started) / iterations)
+        RESULTS.append((self.name, timings, self.extra_info))
+        return result
+
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:
+    @pytest.fixture
+    def benchmark(request):
+        return Benchmark(request.node.name)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not RESULTS:
+        return
+    terminalreporter.section('benchmarks (мс)')
+    terminalreporter.write_line(
+        f'{"name":<45}{"min":>9}{"median":>9}{"max":>9}{"queries":>9}'
+    )
+    for name, timings, extra_info in RESULTS:
+        terminalreporter.write_line(
+            f'{name:<45}'
+            f'{min(timings) * 1000:>9.2f}'
+            f'{statistics.median(timings) * 1000:>9.2f}'
+            f'{max(timings) * 1000:>9.2f}'
+            f'{extra_info.get("queries", ""):>9}'
+        )
+
+
+@pytest.fixture(scope='session')
+def dataset(django_db_setup, django_db_blocker):
+    with django_db_blocker.unblock():
+        return generate(users=30, recipes=300, favourites=1500, carts=300)
+
+
+@pytest.fixture
+def heavy_user(dataset):
+    """Самый популярный автор: больше всего рецептов и подписчиков."""
+    return User.objects.get(id=dataset.users[0])
+
+
+@pytest.fixture
+def user_client(heavy_user):
+    client = APIClient()
+    client.force_authenticate(heavy_user)
+    return client
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
@@ -0,0 +1,215 @@
+"""
+Синтетические данные для бенчмарков и нагрузочных тестов.
+
+Авторы рецептов, избранное, корзины и подписки распределены по Ципфу:
+немного популярных рецептов и авторов и длинный хвост.
+
+    python -m benchmarks.datagen --users 200 --recipes 5000
+"""
+import argparse
+import random
+from collections import namedtuple
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+
+PASSWORD = 'benchmark'
+TAGS = (
+    ('Завтрак', '#fdbdba', 'breakfast'),
+    ('Обед', '#98ff98', 'lunch'),
+    ('Ужин', '#8a2be2', 'dinner'),
+)
+
+Dataset = namedtuple('Dataset', 'users recipes tags ingredients')
+
+
+class Zipf:
+    """Номера 0..n-1, номер k выпадает с вероятностью ~ 1 / (k + 1) ** s."""
+
+    def __init__(self, n, s, rng):
+        self.rng = rng
+        self.population = range(n)
+        self.cum_weights = list(
+            accumulate(1 / (rank + 1) ** s for rank in self.population)
+        )
+
+    def sample(self, k=1):
+        return self.rng.choices(
+            self.population, cum_weights=self.cum_weights, k=k
+        )
+
+
+def pairs(left, right, count, rng, zipf_s, exclude_equal=False):
+    """Уникальные пары: left выбирается равномерно, right — по Ципфу."""
+    count = min(count, len(left) * len(right))
+    zipf = Zipf(len(right), zipf_s, rng)
+    result = set()
+    for _ in range(count * 20):
+        if len(result) >= count:
+            break
+        pair = (rng.choice(left), right[zipf.sample()[0]])
+        if not (exclude_equal and pair[0] == pair[1]):
+            result.add(pair)
+    return result
+
+
+def load_ingredients():
+    from api.management.loaders import BulkLoader, iter_file_rows
+    from recipes.models import Ingredient
+
+    fields = ('name', 'measurement_unit')
+    BulkLoader(Ingredient, fields, fields).load(
+        iter_file_rows('ingredients.csv', fields)
+    )
+    return list(Ingredient.objects.values_list('id', flat=True))
+
+
+def generate(users=50, recipes=500, favourites=2000, carts=300,
+             follows=300, ingredients_per_recipe=(3, 12), zipf_s=1.1,
+             seed=0):
+    """Создаёт данные одним набором bulk-вставок и возвращает их id."""
+    from django.db import transaction
+
+    from api.cache import get_cache
+    from api.indexes import (
+        ingredient_index,
+        recipe_ingredient_index,
+        tag_index
+    )
+    from recipes.models import (
+        Cart,
+        CartIngredientTotal,
+        Favourite,
+        Follow,
+        IngredientAmount,
+        Recipe,
+        Tag,
+        User
+    )
+
+    rng = random.Random(seed)
+    prefix = f'bench{seed}-'
+    with transaction.atomic():
+        ingredient_ids = load_ingredients()
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            User(
+                email=f'{prefix}{number}@example.com',
+                username=f'{prefix}{number}',
+                first_name='Bench',
+                last_name=str(number),
+                password=password,
+            )
+            for number in range(users)
+        )
+        user_ids = list(User.objects.filter(
+            username__startswith=prefix
+        ).order_by('id').values_list('id', flat=True))
+        tag_ids = []
+        for name, color, slug in TAGS:
+            tag, _ = Tag.objects.get_or_create(
+                slug=slug,
+                defaults={
+                    'name': name, 'color': color, 'author_id': user_ids[0]
+                }
+            )
+            tag_ids.append(tag.id)
+
+        authors = Zipf(users, zipf_s, rng).sample(recipes)
+        Recipe.objects.bulk_create(
+            Recipe(
+                author_id=user_ids[author],
+                name=f'{prefix}recipe {number}',
+                text='Синтетический рецепт для бенчмарков. ' * 5,
+                cooking_time=rng.randint(5, 120),
+            )
+            for number, author in enumerate(authors)
+        )
+        recipe_ids = list(Recipe.objects.filter(
+            name__startswith=prefix
+        ).order_by('id').values_list('id', flat=True))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, rng.randint(1, len(tag_ids)))
+        )
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(
+                ingredient_ids, rng.randint(*ingredients_per_recipe)
+            )
+        )
+        for model, count in ((Favourite, favourites), (Cart, carts)):
+            model.objects.bulk_create(
+                (
+                    model(user_id=user_id, recipe_id=recipe_id)
+                    for user_id, recipe_id in pairs(
+                        user_ids, recipe_ids, count, rng, zipf_s
+                    )
+                ),
+                ignore_conflicts=True
+            )
+        Follow.objects.bulk_create(
+            (
+                Follow(user_id=user_id, author_id=author_id)
+                for user_id, author_id in pairs(
+                    user_ids, user_ids, follows, rng, zipf_s, True
+                )
+            ),
+            ignore_conflicts=True
+        )
+        CartIngredientTotal.objects.rebuild()
+        Recipe.objects.update_search_vectors(recipe_ids)
+    get_cache().clear()
+    ingredient_index.invalidate()
+    recipe_ingredient_index.invalidate()
+    tag_index.invalidate()
+    return Dataset(user_ids, recipe_ids, tag_ids, ingredient_ids)
+
+
+def main():
+    import django
+
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--recipes', type=int, default=5000)
+    parser.add_argument('--favourites', type=int, default=20000)
+    parser.add_argument('--carts', type=int, default=3000)
+    parser.add_argument('--follows', type=int, default=2000)
+    parser.add_argument('--zipf', type=float, default=1.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    django.setup()
+    dataset = generate(
+        users=args.users,
+        recipes=args.recipes,
+        favourites=args.favourites,
+        carts=args.carts,
+        follows=args.follows,
+        zipf_s=args.zipf,
+        seed=args.seed,
+    )
+    print(
+        f'Пользователей: {len(dataset.users)}, '
+        f'рецептов: {len(dataset.recipes)}. '
+        f'Пароль у всех: {PASSWORD}, самый активный автор: '
+        f'bench{args.seed}-0@example.com'
+    )
+    from api.cache import cache_is_shared
+    if not cache_is_shared():
+        print(
+            'Кэш API локален для процесса: перезапустите запущенный '
+            'сервер, иначе он будет отдавать старые данные'
+        )
+
+
+if __name__ == '__main__':
+    import os
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+    main()
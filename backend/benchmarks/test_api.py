@@ -0,0 +1,100 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe, User
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1Pe'
+    'AAAADElEQVR4nGNgYGAAAAAEAAH2FzhVAAAAAElFTkSuQmCC'
+)
+
+
+def run(benchmark, request, status=200, cold=False):
+    """Замеряет запрос; число SQL-запросов берётся с холодного кэша."""
+    cache.clear()
+    with CaptureQueriesContext(connection) as queries:
+        assert request().status_code == status
+    benchmark.extra_info['queries'] = len(queries)
+    if cold:
+        return benchmark.pedantic(request, setup=cache.clear, rounds=20)
+    return benchmark(request)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('cold', [True, False], ids=['cold', 'warm'])
+def test_recipe_list(benchmark, client, dataset, cold):
+    run(benchmark, lambda: client.get('/api/recipes/', {'page': 2}), cold=cold)
+
+
+@pytest.mark.django_db
+def test_recipe_list_user_filters(benchmark, user_client, dataset):
+    run(benchmark, lambda: user_client.get(
+        '/api/recipes/', {'is_favorited': 1, 'tags': 'breakfast'}
+    ), cold=True)
+
+
+@pytest.mark.django_db
+def test_recipe_detail(benchmark, user_client, dataset):
+    run(benchmark, lambda: user_client.get(
+        f'/api/recipes/{dataset.recipes[0]}/'
+    ))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    'name', ['с', 'сах', 'ъыь'], ids=['letter', 'prefix', 'miss']
+)
+def test_ingredient_autocomplete(benchmark, client, dataset, name):
+    run(benchmark, lambda: client.get('/api/ingredients/', {'name': name}))
+
+
+@pytest.mark.django_db
+def test_subscriptions(benchmark, dataset):
+    follower = User.objects.filter(id__in=dataset.users).annotate(
+        follows=Count('follower')
+    ).order_by('-follows').first()
+    client = APIClient()
+    client.force_authenticate(follower)
+    run(benchmark, lambda: client.get(
+        '/api/users/subscriptions/', {'recipes_limit': 3}
+    ))
+
+
+@pytest.mark.django_db
+def test_download_shopping_cart(benchmark, dataset):
+    buyer = User.objects.filter(id__in=dataset.users).annotate(
+        carts_count=Count('carts')
+    ).order_by('-carts_count').first()
+    client = APIClient()
+    client.force_authenticate(buyer)
+
+    def download():
+        response = client.get('/api/recipes/download_shopping_cart/')
+        b''.join(response.streaming_content)
+        return response
+
+    run(benchmark, download)
+
+
+@pytest.mark.django_db
+def test_recipe_create(benchmark, settings, media_root, user_client, dataset):
+    settings.IMAGE_PROCESSING_BACKEND = 'sync'
+    payload = {
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 10}
+            for ingredient_id in dataset.ingredients[:8]
+        ],
+        'tags': dataset.tags,
+        'image': IMAGE,
+        'name': 'Benchmark',
+        'text': 'Benchmark recipe',
+        'cooking_time': 10,
+    }
+    run(benchmark, lambda: user_client.post(
+        '/api/recipes/', payload, format='json'
+    ), status=201)
+    assert Recipe.objects.filter(name='Benchmark').exists()
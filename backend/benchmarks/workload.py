@@ -0,0 +1,252 @@
+"""
+Скриптовая нагрузка на запущенный сервер в духе locust.
+
+Несколько потоков выполняют взвешенный набор сценариев, для каждого
+сценария сохраняются p50/p95/p99 и число SQL-запросов на запрос
+(заголовок X-Query-Count, включается METRICS_QUERY_COUNT_HEADER).
+
+    python -m benchmarks.workload --base-url http://localhost:8000 \\
+        --email bench0-0@example.com --output baseline.json
+    python -m benchmarks.workload ... --compare baseline.json
+
+С --compare код выхода 1, если p95 вырос больше допуска или выросло
+число запросов к БД.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+from benchmarks.datagen import PASSWORD
+
+QUANTILES = (50, 95, 99)
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1Pe'
+    'AAAADElEQVR4nGNgYGAAAAAEAAH2FzhVAAAAAElFTkSuQmCC'
+)
+
+
+class Workload:
+    def __init__(self, base_url, token, seed=0):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.recipe_ids = []
+        self.ingredient_ids = []
+        self.tags = []
+
+    def session(self):
+        session = requests.Session()
+        session.headers['Authorization'] = f'Token {self.token}'
+        return session
+
+    def prepare(self):
+        session = self.session()
+        recipes = session.get(
+            f'{self.base_url}/api/recipes/', params={'limit': 100}
+        ).json()
+        self.recipe_ids = [recipe['id'] for recipe in recipes['results']]
+        ingredients = session.get(
+            f'{self.base_url}/api/ingredients/', params={'name': 'с'}
+        ).json()
+        self.ingredient_ids = [item['id'] for item in ingredients[:50]]
+        tags = session.get(f'{self.base_url}/api/tags/').json()
+        self.tags = [tag['id'] for tag in tags]
+        if not self.recipe_ids or not self.ingredient_ids:
+            raise SystemExit(
+                'Нет рецептов или ингредиентов: '
+                'сначала запустите python -m benchmarks.datagen'
+            )
+
+    def scenarios(self, rng):
+        """Сценарии с весами: чтение встречается намного чаще записи."""
+        return (
+            (40, 'recipe_list', 'get', '/api/recipes/',
+             lambda: {'params': {'page': rng.randint(1, 5)}}),
+            (25, 'recipe_detail', 'get', None, None),
+            (20, 'ingredient_autocomplete', 'get', '/api/ingredients/',
+             lambda: {'params': {'name': rng.choice(('с', 'сах', 'мол'))}}),
+            (8, 'subscriptions', 'get', '/api/users/subscriptions/',
+             lambda: {'params': {'recipes_limit': 3}}),
+            (5, 'download_shopping_cart', 'get',
+             '/api/recipes/download_shopping_cart/', dict),
+            (2, 'recipe_create', 'post', '/api/recipes/',
+             lambda: {'json': self.recipe_payload(rng)}),
+        )
+
+    def recipe_payload(self, rng):
+        return {
+            'ingredients': [
+                {'id': ingredient_id, 'amount': rng.randint(1, 500)}
+                for ingredient_id in rng.sample(
+                    self.ingredient_ids, min(5, len(self.ingredient_ids))
+                )
+            ],
+            'tags': self.tags[:1],
+            'image': IMAGE,
+            'name': f'Workload {rng.random()}',
+            'text': 'Рецепт из нагрузочного теста',
+            'cooking_time': rng.randint(5, 120),
+        }
+
+    def worker(self, number, deadline):
+        rng = random.Random(self.seed + number)
+        session = self.session()
+        scenarios = self.scenarios(rng)
+        weights = [scenario[0] for scenario in scenarios]
+        while time.monotonic() < deadline:
+            _, name, method, path, kwargs = rng.choices(
+                scenarios, weights=weights
+            )[0]
+            if path is None:
+                path = f'/api/recipes/{rng.choice(self.recipe_ids)}/'
+                kwargs = dict
+            started = time.perf_counter()
+            try:
+                response = session.request(
+                    method, f'{self.base_url}{path}', **kwargs()
+                )
+            except requests.RequestException:
+                with self.lock:
+                    self.errors[name] += 1
+                continue
+            elapsed = (time.perf_counter() - started) * 1000
+            with self.lock:
+                if response.status_code >= 400:
+                    self.errors[name] += 1
+                    continue
+                self.timings[name].append(elapsed)
+                if 'X-Query-Count' in response.headers:
+                    self.queries[name].append(
+                        int(response.headers['X-Query-Count'])
+                    )
+
+    def run(self, duration, concurrency):
+        deadline = time.monotonic() + duration
+        threads = [
+            threading.Thread(target=self.worker, args=(number, deadline))
+            for number in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(duration)
+
+    def report(self, duration):
+        scenarios = {}
+        for name in sorted(set(self.timings) | set(self.errors)):
+            timings = sorted(self.timings[name])
+            result = {
+                'requests': len(timings),
+                'errors': self.errors[name],
+                'rps': round(len(timings) / duration, 2),
+            }
+            for quantile in QUANTILES:
+                result[f'p{quantile}_ms'] = round(
+                    percentile(timings, quantile), 2
+                )
+            queries = self.queries[name]
+            # Медиана, а не среднее: попадания в кэш не дают ложных
+            # регрессий при сравнении прогонов.
+            result['queries_per_request'] = (
+                statistics.median(queries) if queries else None
+            )
+            scenarios[name] = result
+        return {'duration': duration, 'scenarios': scenarios}
+
+
+def percentile(values, quantile):
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+    if not values:
+        return 0
+    rank = max(int(round(quantile / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def compare(current, baseline, tolerance):
+    """Список регрессий относительно сохранённого прогона."""
+    regressions = []
+    for name, before in baseline['scenarios'].items():
+        after = current['scenarios'].get(name)
+        if after is None or not after['requests']:
+            regressions.append(f'{name}: нет успешных запросов')
+            continue
+        limit = before['p95_ms'] * (1 + tolerance)
+        if after['p95_ms'] > limit:
+            regressions.append(
+                f'{name}: p95 {after["p95_ms"]} мс > {limit:.2f} мс'
+            )
+        if (
+            before['queries_per_request'] is not None
+            and after['queries_per_request'] is not None
+            and after['queries_per_request'] > before['queries_per_request']
+        ):
+            regressions.append(
+                f'{name}: запросов к БД {after["queries_per_request"]} '
+                f'вместо {before["queries_per_request"]}'
+            )
+    return regressions
+
+
+def login(base_url, email, password):
+    response = requests.post(
+        f'{base_url.rstrip("/")}/api/auth/token/login/',
+        json={'email': email, 'password': password},
+    )
+    response.raise_for_status()
+    return response.json()['auth_token']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--email', default='bench0-0@example.com')
+    parser.add_argument('--password', default=PASSWORD)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='куда сохранить результат в JSON')
+    parser.add_argument('--compare', help='JSON предыдущего прогона')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.2,
+        help='допустимый рост p95, доля (0.2 = 20%%)'
+    )
+    args = parser.parse_args(argv)
+
+    workload = Workload(
+        args.base_url, login(args.base_url, args.email, args.password),
+        args.seed
+    )
+    workload.prepare()
+    result = workload.run(args.duration, args.concurrency)
+    text = json.dumps(result, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    print(text)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            regressions = compare(result, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(regression, file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,7 +14,7 @@ ALLOWED_HOSTS = ['*']
 
 INSTALLED_APPS = [
     'recipes',
-    'api',
+    'api.apps.ApiConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -28,6 +28,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,6 +74,19 @@ DATABASES = {
 }
 
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+API_CACHE_ALIAS = os.getenv('API_CACHE_ALIAS', default='default')
+
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -105,6 +119,7 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+DEFAULT_FILE_STORAGE = 'api.storage.ContentAddressedStorage'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -134,3 +149,59 @@ DJOSER = {
 }
 
 USE_X_FORWARDED_HOST = True
+
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', default=300))
+# индексы рецептов в памяти перестраиваются не реже раза в TTL секунд:
+# с LocMemCache другие процессы не видят версий в кэше
+RECIPE_INDEX_TTL = int(os.getenv('RECIPE_INDEX_TTL', default=60))
+# больше id рецептов фильтр по тегам передаёт в базу подзапросом
+TAG_FILTER_MAX_IDS = int(os.getenv('TAG_FILTER_MAX_IDS', default=1000))
+
+RECIPE_COUNT_CACHE_TTL = int(os.getenv('RECIPE_COUNT_CACHE_TTL', default=30))
+# от скольких строк по pg_class брать оценку вместо COUNT(*);
+# пустое значение отключает оценку
+RECIPE_COUNT_ESTIMATE_MIN = os.getenv(
+    'RECIPE_COUNT_ESTIMATE_MIN', default='10000'
+)
+RECIPE_COUNT_ESTIMATE_MIN = (
+    int(RECIPE_COUNT_ESTIMATE_MIN) if RECIPE_COUNT_ESTIMATE_MIN else None
+)
+
+API_RESPONSE_CACHE_TTL = int(os.getenv('API_RESPONSE_CACHE_TTL', default=600))
+RECIPE_BODY_CACHE_TTL = int(os.getenv('RECIPE_BODY_CACHE_TTL', default=86400))
+RECIPE_OVERLAY_CACHE_TTL = int(
+    os.getenv('RECIPE_OVERLAY_CACHE_TTL', default=300)
+)
+# потолок TTL тел рецептов и оверлеев, если кэш API локален для процесса
+# (LocMemCache): изменения из других процессов его не сбрасывают
+RECIPE_LOCAL_CACHE_TTL = int(os.getenv('RECIPE_LOCAL_CACHE_TTL', default=60))
+
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', default='memory://')
+CELERY_TASK_IGNORE_RESULT = True
+
+# celery, thread (пул потоков в процессе веб-сервера) или sync
+IMAGE_PROCESSING_BACKEND = os.getenv(
+    'IMAGE_PROCESSING_BACKEND', default='thread'
+)
+IMAGE_PROCESSING_WORKERS = int(
+    os.getenv('IMAGE_PROCESSING_WORKERS', default=2)
+)
+IMAGE_UPLOAD_MAX_SIZE = int(
+    os.getenv('IMAGE_UPLOAD_MAX_SIZE', default=10 * 1024 * 1024)
+)
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', default=1600))
+IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', default='JPEG')
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', default=85))
+# ширина, высота, обрезать ли до точного размера
+IMAGE_RENDITIONS = {
+    'card': (480, 320, True),
+    'detail': (960, 640, False),
+    'retina': (1920, 1280, False),
+}
+
+# доступ к /api/metrics/ без входа в админку: Authorization: Bearer <token>
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+# заголовок X-Query-Count с числом SQL-запросов, только не в продакшене
+METRICS_QUERY_COUNT_HEADER = os.getenv(
+    'METRICS_QUERY_COUNT_HEADER', default=''
+).lower() in ('1', 'true', 'yes')
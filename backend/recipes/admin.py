@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import *
+from .signals import recipe_ingredients_changed
 
 
 class IngredientAmountInline(admin.TabularInline):
@@ -17,6 +18,14 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('author', 'name', 'tags')
     inlines = (IngredientAmountInline,)
 
+    def save_related(self, request, form, formsets, change):
+        recipe_ids = (form.instance.id,)
+        carts = list(form.instance.carts.values_list('user_id', flat=True))
+        CartIngredientTotal.objects.remove_recipes(carts, recipe_ids)
+        super().save_related(request, form, formsets, change)
+        CartIngredientTotal.objects.add_recipes(carts, recipe_ids)
+        recipe_ingredients_changed.send(sender=Recipe, recipe_ids=recipe_ids)
+
 
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Tag)
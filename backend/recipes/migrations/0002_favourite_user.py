@@ -0,0 +1,33 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='cart',
+            options={'ordering': ('-id',), 'verbose_name': 'Продуктовая корзина', 'verbose_name_plural': 'Продуктовые корзины'},
+        ),
+        migrations.RenameField(
+            model_name='favourite',
+            old_name='author',
+            new_name='user',
+        ),
+        migrations.AlterField(
+            model_name='ingredientamount',
+            name='ingredient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredientamount_ingredients', to='recipes.Ingredient'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='password',
+            field=models.CharField(max_length=128, verbose_name='password'),
+        ),
+    ]
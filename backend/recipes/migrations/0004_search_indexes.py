@@ -0,0 +1,78 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:25
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def remove_duplicates(apps, schema_editor):
+    Favourite = apps.get_model('recipes', 'Favourite')
+    IngredientAmount = apps.get_model('recipes', 'IngredientAmount')
+    duplicates = Favourite.objects.values('user', 'recipe').annotate(
+        first=Min('id'), count=Count('id')
+    ).filter(count__gt=1)
+    for row in duplicates:
+        Favourite.objects.filter(
+            user=row['user'], recipe=row['recipe']
+        ).exclude(id=row['first']).delete()
+    duplicates = IngredientAmount.objects.values(
+        'recipe', 'ingredient'
+    ).annotate(
+        first=Min('id'), count=Count('id'), total=Sum('amount')
+    ).filter(count__gt=1)
+    for row in duplicates:
+        IngredientAmount.objects.filter(
+            recipe=row['recipe'], ingredient=row['ingredient']
+        ).exclude(id=row['first']).delete()
+        IngredientAmount.objects.filter(id=row['first']).update(
+            amount=row['total']
+        )
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS ingredient_name_trgm '
+        'ON recipes_ingredient USING gin (name gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS ingredient_name_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_cartingredienttotal'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['name'], name='ingredient_name_pattern', opclasses=('varchar_pattern_ops',)),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-id'], name='recipe_author_id_desc'),
+        ),
+        migrations.AddConstraint(
+            model_name='favourite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique favourite user'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientamount',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique recipe ingredient'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -1,8 +1,21 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import PositiveSmallIntegerField
+from django.db import connections, models
+from django.db.models import (
+    BooleanField,
+    Exists,
+    F,
+    OuterRef,
+    PositiveSmallIntegerField,
+    Subquery,
+    Sum,
+    Value,
+    Window
+)
+from django.db.models.functions import RowNumber
 
+from .search import search_recipes, update_search_vectors
 from .validators import (
     TagValidateMixin,
     UserValidateMixin
@@ -35,6 +48,44 @@ class User(AbstractUser, UserValidateMixin):
         return self.is_staff
 
 
+class UserLinkQuerySet(models.QuerySet):
+    """Связи пользователя с рецептами (избранное, корзина) или авторами."""
+    target = 'recipe'
+
+    def add(self, user, ids):
+        """
+        Добавляет связи одним INSERT ... ON CONFLICT DO NOTHING,
+        возвращает id объектов, которых у пользователя ещё не было.
+        """
+        ids = list(ids)
+        if not ids:
+            return set()
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        meta = self.model._meta
+        user_column = quote(meta.get_field('user').column)
+        target_column = quote(meta.get_field(self.target).column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(meta.db_table)} '
+                f'({user_column}, {target_column}) '
+                f'VALUES {", ".join(["(%s, %s)"] * len(ids))} '
+                f'ON CONFLICT DO NOTHING RETURNING {target_column}',
+                [value for pk in ids for value in (user.id, pk)]
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    def remove(self, user, ids):
+        """Удаляет связи одним DELETE, возвращает число удалённых."""
+        return self.filter(
+            user=user, **{f'{self.target}_id__in': ids}
+        ).delete()[0]
+
+
+class FollowQuerySet(UserLinkQuerySet):
+    target = 'author'
+
+
 class Follow(models.Model):
     user = models.ForeignKey(
         User,
@@ -47,6 +98,8 @@ class Follow(models.Model):
         related_name='following'
     )
 
+    objects = FollowQuerySet.as_manager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -90,10 +143,77 @@ class Ingredient(models.Model):
         null=False
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=('name',),
+                name='ingredient_name_pattern',
+                opclasses=('varchar_pattern_ops',)
+            )
+        ]
+
     def __str__(self):
         return self.name[:15]
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_user_flags(self, user):
+        """Признаки избранного, корзины и подписки на автора для user."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+                author_is_subscribed=Value(
+                    False, output_field=BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favourite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(Cart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            author_is_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author')
+            )),
+        )
+
+    def latest_per_author(self, authors, limit=None):
+        """Не больше limit последних рецептов каждого автора одним запросом."""
+        authors = list(authors)
+        if not authors:
+            # пустой IN не собирается в SQL: EmptyResultSet
+            return self.none()
+        queryset = self.filter(author__in=authors).defer('search_vector')
+        if limit is None:
+            return queryset
+        quote = connections[self.db].ops.quote_name
+        columns = ', '.join(
+            quote(field.column) for field in self.model._meta.concrete_fields
+            if field.name != 'search_vector'
+        )
+        sql, params = queryset.annotate(
+            recipe_rank=Window(
+                expression=RowNumber(),
+                partition_by=[F('author')],
+                order_by=F('id').desc()
+            )
+        ).query.sql_with_params()
+        return self.raw(
+            f'SELECT {columns} FROM ({sql}) ranked WHERE recipe_rank <= %s '
+            'ORDER BY recipe_rank',
+            params + (limit,)
+        )
+
+    def search(self, text):
+        """Полнотекстовый поиск с сортировкой по рангу search_rank."""
+        return search_recipes(self, text)
+
+    def update_search_vectors(self, recipe_ids=None):
+        update_search_vectors(connections[self.db], recipe_ids)
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -128,9 +248,18 @@ class Recipe(models.Model):
         default=0,
         null=False
     )
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-id',)
+        indexes = [
+            models.Index(
+                fields=('author', '-id'),
+                name='recipe_author_id_desc'
+            )
+        ]
 
     def __str__(self):
         return self.name[:15]
@@ -148,6 +277,16 @@ class Favourite(models.Model):
         on_delete=models.CASCADE
     )
 
+    objects = UserLinkQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique favourite user'
+            )
+        ]
+
 
 class IngredientAmount(models.Model):
     recipe = models.ForeignKey(
@@ -165,6 +304,14 @@ class IngredientAmount(models.Model):
         validators=[MinValueValidator(1)]
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique recipe ingredient'
+            )
+        ]
+
     def __str__(self):
         return "{}{}".format(self.recipe.__str__(), self.ingredient.__str__())
 
@@ -181,6 +328,8 @@ class Cart(models.Model):
         related_name='carts',
     )
 
+    objects = UserLinkQuerySet.as_manager()
+
     class Meta:
         ordering = ('-id',)
         constraints = [
@@ -191,3 +340,85 @@ class Cart(models.Model):
         ]
         verbose_name = 'Продуктовая корзина'
         verbose_name_plural = 'Продуктовые корзины'
+
+
+class CartIngredientTotalQuerySet(models.QuerySet):
+    def _shift(self, users, recipes, sign):
+        amounts = IngredientAmount.objects.filter(
+            recipe__in=recipes,
+            ingredient=OuterRef('ingredient')
+        ).values('ingredient').annotate(total=Sum('amount')).values('total')
+        return self.filter(
+            user__in=users,
+            ingredient__in=IngredientAmount.objects.filter(
+                recipe__in=recipes
+            ).values('ingredient')
+        ).update(amount=F('amount') + sign * Subquery(amounts))
+
+    def add_recipes(self, users, recipes):
+        """Добавляет ингредиенты рецептов recipes в корзины users."""
+        ingredients = set(IngredientAmount.objects.filter(
+            recipe__in=recipes
+        ).values_list('ingredient_id', flat=True))
+        self.bulk_create(
+            (
+                CartIngredientTotal(
+                    user_id=user, ingredient_id=ingredient, amount=0
+                )
+                for user in users
+                for ingredient in ingredients
+            ),
+            ignore_conflicts=True
+        )
+        self._shift(users, recipes, 1)
+
+    def remove_recipes(self, users, recipes):
+        """Убирает ингредиенты рецептов recipes из корзин users."""
+        self._shift(users, recipes, -1)
+        self.filter(user__in=users, amount__lte=0).delete()
+
+    def expected(self):
+        return IngredientAmount.objects.filter(
+            recipe__carts__isnull=False
+        ).values(
+            'ingredient',
+            user=F('recipe__carts__user'),
+        ).annotate(total=Sum('amount')).order_by()
+
+    def rebuild(self):
+        self.all().delete()
+        return len(self.bulk_create(
+            CartIngredientTotal(
+                user_id=row['user'],
+                ingredient_id=row['ingredient'],
+                amount=row['total']
+            )
+            for row in self.expected().iterator()
+        ))
+
+
+class CartIngredientTotal(models.Model):
+    """Сумма ингредиентов по всем рецептам в корзине пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart_totals',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='cart_totals',
+    )
+    amount = models.IntegerField(default=0)
+
+    objects = CartIngredientTotalQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique cart ingredient total'
+            )
+        ]
+        verbose_name = 'Ингредиент в корзине'
+        verbose_name_plural = 'Ингредиенты в корзине'
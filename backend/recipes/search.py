@@ -0,0 +1,159 @@
+"""
+Полнотекстовый поиск рецептов по названию, ингредиентам и тексту.
+
+На PostgreSQL у рецепта хранится tsvector с весами A (название),
+B (ингредиенты) и C (текст) под GIN-индексом, ранжирование — ts_rank.
+На SQLite те же три колонки лежат в виртуальной таблице FTS5,
+ранжирование — bm25 с теми же приоритетами колонок.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import DatabaseError, connections
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+INDEX_NAME = 'recipe_search_vector'
+# веса колонок name, ingredients, text для bm25
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+
+INGREDIENT_NAMES = (
+    'SELECT {aggregate} FROM recipes_ingredientamount amount '
+    'JOIN recipes_ingredient ingredient '
+    'ON ingredient.id = amount.ingredient_id '
+    'WHERE amount.recipe_id = recipes_recipe.id'
+)
+
+
+def fts5_available(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if cursor.fetchone()[0]:
+            return True
+        # в некоторых сборках FTS5 есть, но опция не записана
+        try:
+            cursor.execute(
+                'CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(value)'
+            )
+            cursor.execute('DROP TABLE temp.fts5_probe')
+        except DatabaseError:
+            return False
+    return True
+
+
+def has_fts_table(connection):
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+def create_search_index(schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+            'ON recipes_recipe USING gin (search_vector)'
+        )
+    elif connection.vendor == 'sqlite' and fts5_available(connection):
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+            'USING fts5(name, ingredients, text, '
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    update_search_vectors(connection)
+
+
+def drop_search_index(schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def update_search_vectors(connection, recipe_ids=None):
+    """
+    Пересчитывает поисковый индекс рецептов recipe_ids (всех, если None).
+    Удалённые рецепты из индекса SQLite тоже убираются.
+    """
+    if recipe_ids is not None:
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+    if connection.vendor == 'postgresql':
+        ingredients = INGREDIENT_NAMES.format(
+            aggregate="string_agg(ingredient.name, ' ')"
+        )
+        sql = (
+            'UPDATE recipes_recipe SET search_vector = '
+            "setweight(to_tsvector(%s, name), 'A') || "
+            f"setweight(to_tsvector(%s, coalesce(({ingredients}), '')), 'B') "
+            "|| setweight(to_tsvector(%s, text), 'C')"
+        )
+        params = [SEARCH_CONFIG] * 3
+        if recipe_ids is not None:
+            sql += ' WHERE id = ANY(%s)'
+            params.append(recipe_ids)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+    elif connection.vendor == 'sqlite' and has_fts_table(connection):
+        rowids = ids = ''
+        if recipe_ids is not None:
+            placeholders = ', '.join(['%s'] * len(recipe_ids))
+            rowids = f' WHERE rowid IN ({placeholders})'
+            ids = f' WHERE id IN ({placeholders})'
+        ingredients = INGREDIENT_NAMES.format(
+            aggregate="group_concat(ingredient.name, ' ')"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}{rowids}', recipe_ids)
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) '
+                f"SELECT id, name, coalesce(({ingredients}), ''), text "
+                f'FROM recipes_recipe{ids}',
+                recipe_ids
+            )
+
+
+def fts_query(text):
+    """Запрос FTS5 из слов text: каждое слово ищется как префикс."""
+    return ' '.join(
+        '"{}"*'.format(word) for word in re.findall(r'\w+', text.lower())
+    )
+
+
+def search_recipes(queryset, text):
+    """
+    Рецепты, подходящие под запрос text, с рангом search_rank
+    (чем больше, тем лучше), отсортированные по рангу.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(text, config=SEARCH_CONFIG)
+        return queryset.annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).filter(search_vector=query).order_by('-search_rank', '-id')
+    if connection.vendor == 'sqlite' and has_fts_table(connection):
+        match = fts_query(text)
+        if not match:
+            return queryset.none()
+        weights = ', '.join(map(str, FTS_WEIGHTS))
+        # RawSQL в id__in Django 2.2 оборачивает в лишние скобки, и SQLite
+        # видит вместо подзапроса список из одного значения
+        return queryset.extra(
+            where=[
+                f'recipes_recipe.id IN (SELECT rowid FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s)'
+            ],
+            params=[match]
+        ).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = recipes_recipe.id',
+            (match,),
+            output_field=FloatField()
+        )).order_by('-search_rank', '-id')
+    return queryset.filter(
+        Q(name__icontains=text)
+        | Q(text__icontains=text)
+        | Q(ingredient__name__icontains=text)
+    ).distinct()
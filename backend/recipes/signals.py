@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Состав ингредиентов рецептов recipe_ids изменился. Массовые операции
+# не шлют post_save, поэтому сигнал отправляют сериализатор и админка
+# после записи IngredientAmount.
+recipe_ingredients_changed = Signal()
@@ -1,8 +1,14 @@
 import pytest
+from django.core.cache import cache
 
 from recipes.models import Recipe, Tag, Ingredient, User, IngredientAmount
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
 @pytest.fixture
 def user_password() -> str:
     return 'test'
@@ -62,3 +68,35 @@ def recipe_ingredient(recipe, ingredient) -> IngredientAmount:
         amount=1,
     )
     return ia
+
+
+@pytest.fixture
+def another_user() -> User:
+    user, _ = User.objects.get_or_create(
+        email='another@terst.test',
+        username='AnotherUser',
+    )
+    return user
+
+
+@pytest.fixture
+def user_client(user):
+    from rest_framework.test import APIClient
+
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def image_base64() -> str:
+    return (
+        'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1Pe'
+        'AAAADElEQVR4nGNgYGAAAAAEAAH2FzhVAAAAAElFTkSuQmCC'
+    )
@@ -0,0 +1,151 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.indexes import recipe_ingredient_index
+from recipes.models import Ingredient, IngredientAmount, Recipe
+
+URL = '/api/recipes/by_ingredients/'
+
+
+@pytest.fixture
+def pantry(user):
+    """Рецепты из ингредиентов a..e и x."""
+    ingredients = {
+        name: Ingredient.objects.create(name=name, measurement_unit='г')
+        for name in 'abcdex'
+    }
+    recipes = {}
+    for name, composition in (
+        ('ab', 'ab'), ('abc', 'abc'), ('acde', 'acde'), ('x', 'x')
+    ):
+        recipe = Recipe.objects.create(
+            author=user, name=name, text='Текст', cooking_time=1
+        )
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
+                recipe=recipe, ingredient=ingredients[letter], amount=1
+            )
+            for letter in composition
+        )
+        recipes[name] = recipe
+    return ingredients, recipes
+
+
+def ids(*ingredients):
+    return ','.join(str(ingredient.id) for ingredient in ingredients)
+
+
+@pytest.mark.django_db
+def test_recipes_ranked_by_coverage(client, pantry):
+    ingredients, recipes = pantry
+
+    response = client.get(URL, {
+        'ingredients': ids(ingredients['a'], ingredients['b'])
+    })
+
+    assert response.status_code == 200
+    results = response.data['results']
+    assert [item['id'] for item in results] == [
+        recipes['ab'].id, recipes['abc'].id, recipes['acde'].id
+    ]
+    assert [item['coverage'] for item in results] == [1.0, 0.667, 0.25]
+    assert [item['missing'] for item in results] == [0, 1, 3]
+    assert results[1]['missing_ingredients'] == [ingredients['c'].id]
+    assert results[0]['name'] == 'ab'
+
+
+@pytest.mark.django_db
+def test_max_missing_and_repeated_param(client, pantry):
+    ingredients, recipes = pantry
+
+    response = client.get(URL + (
+        f'?ingredients={ingredients["a"].id}'
+        f'&ingredients={ingredients["c"].id}&max_missing=1'
+    ))
+
+    assert [item['id'] for item in response.data['results']] == [
+        recipes['abc'].id, recipes['ab'].id
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('params', [
+    {}, {'ingredients': 'abc'}, {'ingredients': '1', 'max_missing': -1}
+])
+def test_invalid_params(client, params):
+    assert client.get(URL, params).status_code == 400
+
+
+@pytest.mark.django_db
+def test_index_updated_in_place(pantry):
+    ingredients, recipes = pantry
+    recipe_ingredient_index.search((ingredients['x'].id,))
+    IngredientAmount.objects.create(
+        recipe=recipes['ab'], ingredient=ingredients['x'], amount=1
+    )
+    IngredientAmount.objects.filter(
+        recipe=recipes['ab'], ingredient=ingredients['b']
+    ).delete()
+
+    with CaptureQueriesContext(connection) as queries:
+        recipe_ingredient_index.update((recipes['ab'].id,))
+        found = recipe_ingredient_index.search((ingredients['x'].id,))
+
+    assert len(queries) == 1
+    assert [(match.recipe_id, match.missing) for match in found] == [
+        (recipes['x'].id, 0), (recipes['ab'].id, 1)
+    ]
+    assert recipe_ingredient_index.search((ingredients['b'].id,))[0] \
+        .recipe_id == recipes['abc'].id
+
+
+@pytest.mark.django_db(transaction=True)
+def test_index_follows_api_changes(
+        settings, media_root, image_base64, user_client, tag, pantry
+):
+    settings.IMAGE_PROCESSING_BACKEND = 'sync'
+    ingredients, recipes = pantry
+    params = {'ingredients': ids(ingredients['x'])}
+    assert len(user_client.get(URL, params).data['results']) == 1
+
+    response = user_client.post('/api/recipes/', {
+        'ingredients': [{'id': ingredients['x'].id, 'amount': 5}],
+        'tags': [tag.id],
+        'image': image_base64,
+        'name': 'new',
+        'text': 'Текст',
+        'cooking_time': 1,
+    }, format='json')
+    assert response.status_code == 201, response.data
+    assert user_client.delete(
+        f'/api/recipes/{recipes["x"].id}/'
+    ).status_code == 204
+
+    assert [
+        item['id'] for item in user_client.get(URL, params).data['results']
+    ] == [response.data['id']]
+
+
+@pytest.mark.django_db
+def test_index_rebuilt_after_ttl(settings, pantry):
+    ingredients, recipes = pantry
+    recipe_ingredient_index.search((ingredients['x'].id,))
+    # изменение из другого процесса: версия в локальном кэше не меняется
+    IngredientAmount.objects.filter(recipe=recipes['x']).delete()
+    assert len(recipe_ingredient_index.search((ingredients['x'].id,))) == 1
+
+    settings.RECIPE_INDEX_TTL = -1
+    assert recipe_ingredient_index.search((ingredients['x'].id,)) == []
+
+
+@pytest.mark.django_db(transaction=True)
+def test_index_follows_ingredient_delete(pantry):
+    ingredients, recipes = pantry
+    recipe_ingredient_index.search((ingredients['a'].id,))
+    ingredients['b'].delete()
+
+    found = recipe_ingredient_index.search((ingredients['a'].id,))
+    assert [(match.recipe_id, match.missing) for match in found][:2] == [
+        (recipes['ab'].id, 0), (recipes['abc'].id, 1)
+    ]
@@ -0,0 +1,180 @@
+import base64
+import hashlib
+import io
+import os
+from io import BytesIO
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from api.images import RawBase64ImageField, dispatch, process_recipe_image
+from api.renditions import (
+    generate_renditions, rendition_name, source_hash
+)
+from recipes.models import Ingredient, Recipe
+
+
+def make_jpeg(size=(2000, 1000), orientation=None):
+    image = Image.new('RGB', size, 'red')
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera'
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def raw_recipe(media_root, recipe):
+    recipe.image.save('raw_photo.jpg', ContentFile(make_jpeg(orientation=6)))
+    return recipe
+
+
+def test_raw_base64_image_field(image_base64):
+    field = RawBase64ImageField()
+    image = field.run_validation(image_base64)
+    assert image.name.startswith('raw_') and image.name.endswith('.png')
+    for value in (
+        'data:image/png;base64,' + base64.b64encode(b'not an image').decode(),
+        'data:image/png;base64,###',
+    ):
+        with pytest.raises(ValidationError):
+            field.run_validation(value)
+    with pytest.raises(ValidationError):
+        field.run_validation(SimpleUploadedFile('photo.png', b'<html>'))
+
+
+@pytest.mark.django_db
+def test_multipart_image_rejected(media_root, user_client, recipe):
+    response = user_client.patch(
+        f'/api/recipes/{recipe.id}/',
+        {'image': SimpleUploadedFile('page.html', b'<html></html>')},
+        format='multipart'
+    )
+    assert response.status_code == 400
+    assert 'image' in response.data
+    assert not list(media_root.rglob('*.html'))
+
+
+@pytest.mark.django_db
+def test_process_recipe_image(settings, media_root, raw_recipe):
+    settings.IMAGE_MAX_DIMENSION = 500
+    source = raw_recipe.image.path
+    process_recipe_image(raw_recipe.id)
+
+    raw_recipe.refresh_from_db()
+    assert os.path.exists(source)
+    assert not os.path.basename(raw_recipe.image.name).startswith('raw_')
+    with Image.open(raw_recipe.image.path) as image:
+        # поворот по EXIF применён, метаданные удалены
+        assert image.size == (250, 500)
+        assert not image.getexif()
+    digest = source_hash(raw_recipe.image.storage, raw_recipe.image.name)
+    with Image.open(media_root / rendition_name(digest, 'card')) as card:
+        assert card.size == (480, 320)
+
+    name = raw_recipe.image.name
+    process_recipe_image(raw_recipe.id)
+    raw_recipe.refresh_from_db()
+    assert raw_recipe.image.name == name
+
+
+@pytest.mark.django_db(transaction=True)
+def test_image_processed_after_commit(
+    settings, media_root, image_base64, user_client, tag
+):
+    settings.IMAGE_PROCESSING_BACKEND = 'sync'
+    ingredient = Ingredient.objects.create(name='соль', measurement_unit='г')
+    response = user_client.post('/api/recipes/', {
+        'ingredients': [{'id': ingredient.id, 'amount': 5}],
+        'tags': [tag.id],
+        'image': image_base64,
+        'name': 'Recipe',
+        'text': 'Test recipe',
+        'cooking_time': 1,
+    }, format='json')
+    assert response.status_code == 201, response.data
+    assert '/raw_' in response.data['image']
+    image = Recipe.objects.get(id=response.data['id']).image
+    assert image.name.endswith('.jpg')
+    assert not os.path.basename(image.name).startswith('raw_')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_image_thread_backend(settings, raw_recipe):
+    settings.IMAGE_PROCESSING_BACKEND = 'thread'
+    dispatch(raw_recipe.id).result(timeout=10)
+    raw_recipe.refresh_from_db()
+    assert not os.path.basename(raw_recipe.image.name).startswith('raw_')
+
+
+@pytest.mark.django_db
+def test_image_renditions_generated_on_first_request(
+    media_root, client, recipe
+):
+    recipe.image.save('photo.jpg', ContentFile(make_jpeg()))
+    renditions = client.get(
+        f'/api/recipes/{recipe.id}/'
+    ).data['image_renditions']
+    assert set(renditions) == {'card', 'detail', 'retina'}
+    assert renditions['card'].endswith(f'/api/recipes/{recipe.id}/image/card/')
+
+    response = client.get(renditions['card'])
+    digest = source_hash(recipe.image.storage, recipe.image.name)
+    assert response.status_code == 302
+    assert response['Location'] == f'/media/{rendition_name(digest, "card")}'
+    with Image.open(media_root / rendition_name(digest, 'card')) as card:
+        assert card.size == (480, 320)
+    assert not (media_root / rendition_name(digest, 'detail')).exists()
+
+    response = client.get(f'/api/recipes/{recipe.id}/')
+    assert response.data['image_renditions']['card'] == (
+        f'http://testserver/media/{rendition_name(digest, "card")}'
+    )
+    assert client.get(
+        f'/api/recipes/{recipe.id}/image/huge/'
+    ).status_code == 404
+
+
+@pytest.mark.django_db
+def test_content_addressed_storage(media_root, recipe, user):
+    content = make_jpeg(size=(10, 10))
+    recipe.image.save('first.JPG', ContentFile(content))
+    other = Recipe.objects.create(
+        author=user, name='Other', text='Test', cooking_time=1
+    )
+    other.image.save('second.jpg', ContentFile(content))
+    digest = hashlib.sha256(content).hexdigest()
+    assert recipe.image.name == other.image.name == (
+        f'recipes/{digest[:2]}/{digest}.jpg'
+    )
+    assert len(list((media_root / 'recipes').rglob('*.jpg'))) == 1
+
+    other.image.save('page.html', ContentFile(b'<html></html>'))
+    assert other.image.name.endswith('.bin')
+
+
+@pytest.mark.django_db
+def test_gc_media(media_root, recipe):
+    recipe.image.save('old.jpg', ContentFile(make_jpeg(size=(10, 10))))
+    old = recipe.image.path
+    generate_renditions(recipe.image)
+    recipe.image.save('new.jpg', ContentFile(make_jpeg(size=(20, 20))))
+    generate_renditions(recipe.image)
+    assert os.path.exists(old)
+
+    output = io.StringIO()
+    call_command('gc_media', stdout=output)
+    assert 'удалено: 0' in output.getvalue()
+
+    call_command('gc_media', min_age=0, dry_run=True, stdout=output)
+    assert os.path.exists(old)
+    call_command('gc_media', min_age=0, stdout=output)
+    assert not os.path.exists(old)
+    assert os.path.exists(recipe.image.path)
+    assert len(list((media_root / 'renditions').rglob('*.jpg'))) == 3
@@ -0,0 +1,56 @@
+import pytest
+from django.db import connection
+
+from recipes.models import Favourite, Ingredient, IngredientAmount, Recipe
+
+
+pytestmark = pytest.mark.skipif(
+    connection.vendor != 'postgresql',
+    reason='Планы запросов проверяются только для PostgreSQL'
+)
+
+
+@pytest.fixture
+def without_seqscan():
+    with connection.cursor() as cursor:
+        cursor.execute('SET enable_seqscan = off')
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('queryset,index', [
+    (
+        lambda user, recipe: Favourite.objects.filter(
+            user=user, recipe=recipe
+        ),
+        'unique favourite user'
+    ),
+    (
+        lambda user, recipe: IngredientAmount.objects.filter(
+            recipe=recipe, ingredient__name='test'
+        ).values('amount'),
+        'unique recipe ingredient'
+    ),
+    (
+        lambda user, recipe: Recipe.objects.filter(author=user)[:6],
+        'recipe_author_id_desc'
+    ),
+])
+def test_index_is_used(without_seqscan, user, recipe, queryset, index):
+    plan = queryset(user, recipe).explain()
+    assert index in plan, plan
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('lookup,index', [
+    ('name__startswith', 'ingredient_name_pattern'),
+    ('name__contains', 'ingredient_name_trgm'),
+])
+def test_ingredient_name_index_is_used(without_seqscan, lookup, index):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_indexes WHERE indexname = %s', (index,)
+        )
+        if cursor.fetchone() is None:
+            pytest.skip(f'{index} не создан: нет расширения pg_trgm')
+    plan = Ingredient.objects.filter(**{lookup: 'сах'}).explain()
+    assert index in plan, plan
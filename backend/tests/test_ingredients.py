@@ -0,0 +1,48 @@
+import pytest
+
+from api.indexes import ingredient_index
+from recipes.models import Ingredient
+
+
+@pytest.fixture
+def ingredients():
+    ingredient_index.invalidate()
+    return [
+        Ingredient.objects.create(name=name, measurement_unit='г')
+        for name in ('сахарная пудра', 'ванильный сахар', 'сахар', 'соль')
+    ]
+
+
+@pytest.mark.django_db
+def test_ingredient_search_order(client, ingredients):
+    response = client.get('/api/ingredients/', {'name': 'сахар'})
+    assert response.status_code == 200
+    assert [item['name'] for item in response.data] == [
+        'сахар', 'сахарная пудра', 'ванильный сахар'
+    ]
+
+
+@pytest.mark.django_db
+def test_ingredient_search_layout(client, ingredients):
+    response = client.get('/api/ingredients/', {'name': 'cjkm'})
+    assert [item['name'] for item in response.data] == ['соль']
+
+
+@pytest.mark.django_db
+def test_ingredient_search_without_queries(
+    django_assert_num_queries, client, ingredients
+):
+    client.get('/api/ingredients/', {'name': 'с'})
+    with django_assert_num_queries(0):
+        response = client.get('/api/ingredients/', {'name': 'пу'})
+    assert [item['name'] for item in response.data] == ['сахарная пудра']
+
+
+@pytest.mark.django_db
+def test_ingredient_search_invalidation(client, ingredients):
+    client.get('/api/ingredients/', {'name': 'сол'})
+    Ingredient.objects.create(name='соленый огурец', measurement_unit='шт')
+    response = client.get('/api/ingredients/', {'name': 'сол'})
+    assert [item['name'] for item in response.data] == [
+        'соленый огурец', 'соль'
+    ]
@@ -0,0 +1,130 @@
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from api.indexes import ingredient_index, tag_index
+from api.management.loaders import iter_json_array
+from recipes.models import Ingredient, IngredientAmount, Tag, User
+
+
+def load(command, *args, **options):
+    out = io.StringIO()
+    call_command(command, *args, stdout=out, **options)
+    return out.getvalue()
+
+
+def test_iter_json_array_small_chunks():
+    items = [{'name': f'имя {number}', 'unit': '"г"'} for number in range(5)]
+    file = io.StringIO(json.dumps(items, ensure_ascii=False))
+    assert list(iter_json_array(file, chunk_size=7)) == items
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('{"name": 1}')))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('no_copy', [False, True])
+def test_load_ingredients(django_assert_max_num_queries, tmp_path, no_copy):
+    Ingredient.objects.create(name='соль', measurement_unit='г')
+    assert ingredient_index.search('сахар') == []
+    path = tmp_path / 'ingredients.csv'
+    path.write_text(
+        'соль,г\nсахар,г\nсахар,г\nсахар,кг\nмука,г\n', encoding='utf-8'
+    )
+    with django_assert_max_num_queries(6):
+        output = load(
+            'load_ingredients', str(path), batch_size=2, no_copy=no_copy
+        )
+    assert 'Прочитано 5, добавлено 3' in output
+    assert Ingredient.objects.count() == 4
+    assert [item.name for item in ingredient_index.search('сахар')] == [
+        'сахар', 'сахар'
+    ]
+    assert 'добавлено 0' in load('load_ingredients', str(path))
+
+
+@pytest.mark.django_db
+def test_load_ingredients_json(tmp_path):
+    path = tmp_path / 'ingredients.json'
+    path.write_text(json.dumps([
+        {'name': 'соль', 'measurement_unit': 'г'},
+        {'name': 'соль', 'measurement_unit': 'г'},
+    ]), encoding='utf-8')
+    load('load_ingredients', str(path))
+    assert Ingredient.objects.count() == 1
+    path.write_text('[{"name": "соль"}]', encoding='utf-8')
+    with pytest.raises(CommandError):
+        load('load_ingredients', str(path))
+
+
+@pytest.mark.django_db
+def test_load_tags_author(tmp_path, user):
+    path = tmp_path / 'tags.csv'
+    path.write_text('Завтрак,#fdbdba,breakfast\n', encoding='utf-8')
+    with pytest.raises(CommandError):
+        load('load_tags', str(path))
+    assert tag_index.slugs() == []
+    load('load_tags', str(path), author=user.email)
+    assert Tag.objects.get(slug='breakfast').author == user
+    assert tag_index.slugs() == ['breakfast']
+
+    admin = User.objects.create(
+        email='admin@test.test', username='admin', is_superuser=True
+    )
+    path.write_text('Обед,#98ff98,lunch\n', encoding='utf-8')
+    load('load_tags', str(path))
+    assert Tag.objects.get(slug='lunch').author == admin
+
+
+@pytest.mark.django_db
+def test_sync_ingredients(tmp_path, recipe):
+    salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+    sugar = Ingredient.objects.create(name='сахар', measurement_unit='г')
+    flour = Ingredient.objects.create(name='мука', measurement_unit='г')
+    used = Ingredient.objects.create(name='перец', measurement_unit='г')
+    IngredientAmount.objects.create(recipe=recipe, ingredient=used, amount=1)
+    path = tmp_path / 'ingredients.csv'
+    path.write_text('соль,г\nсахар,кг\nмасло,мл\n', encoding='utf-8')
+
+    output = load('sync_ingredients', str(path), delete=True, dry_run=True)
+    assert 'добавлено 1, изменено 1, удалено 1' in output
+    assert Ingredient.objects.count() == 4
+
+    load('sync_ingredients', str(path), delete=True)
+    assert set(Ingredient.objects.values_list('name', 'measurement_unit')) == {
+        ('соль', 'г'), ('сахар', 'кг'), ('масло', 'мл'), ('перец', 'г')
+    }
+    assert Ingredient.objects.get(id=sugar.id).measurement_unit == 'кг'
+    assert Ingredient.objects.filter(id=salt.id).exists()
+    assert not Ingredient.objects.filter(id=flour.id).exists()
+    assert [item.name for item in ingredient_index.search('мас')] == [
+        'масло'
+    ]
+    output = load('sync_ingredients', str(path))
+    assert 'добавлено 0, изменено 0, удалено 0' in output
+
+
+@pytest.mark.django_db
+def test_load_ingredients_data_file():
+    output = load('load_ingredients', no_copy=True)
+    assert 'Прочитано 2188, добавлено 2188' in output
+
+
+@pytest.mark.django_db
+def test_load_warns_about_local_cache(settings, tmp_path):
+    path = tmp_path / 'ingredients.csv'
+    err = io.StringIO()
+    path.write_text('соль,г\n', encoding='utf-8')
+    load('load_ingredients', str(path), stderr=err)
+    assert 'Кэш API локален' in err.getvalue()
+
+    settings.CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(tmp_path / 'cache'),
+    }}
+    err = io.StringIO()
+    path.write_text('сахар,г\n', encoding='utf-8')
+    load('sync_ingredients', str(path), stderr=err)
+    assert err.getvalue() == ''
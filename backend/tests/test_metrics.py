@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from api.metrics import Histogram, registry
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    registry.reset()
+
+
+def test_histogram_quantiles():
+    histogram = Histogram()
+    values = [random.randint(1, 10 ** 7) for _ in range(10000)]
+    for value in values:
+        histogram.record(value)
+    values.sort()
+    for quantile in (0.5, 0.9, 0.99):
+        exact = values[int(quantile * len(values)) - 1]
+        assert abs(histogram.quantile(quantile) - exact) <= exact / 2 ** 5
+    assert histogram.quantile(1) == values[-1]
+    assert histogram.count == len(values)
+
+
+@pytest.mark.django_db
+def test_metrics_middleware(settings, client, user, tag):
+    settings.METRICS_QUERY_COUNT_HEADER = True
+    settings.METRICS_TOKEN = 'secret'
+    response = client.get('/api/tags/')
+    assert response['X-Query-Count'] == '1'
+    client.get(f'/api/tags/{tag.id}/')
+    client.get('/api/missing/')
+
+    assert client.get('/api/metrics/').status_code == 403
+    assert client.get(
+        '/api/metrics/', HTTP_AUTHORIZATION='Bearer wrong'
+    ).status_code == 403
+    response = client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+    assert response.status_code == 200
+    text = response.content.decode()
+    assert (
+        'foodgram_http_requests_total'
+        '{route="tags.list",method="GET",status="200"} 1'
+    ) in text
+    assert 'route="tags.retrieve"' in text
+    assert 'route="unmatched",method="GET",status="404"' in text
+    assert (
+        'foodgram_db_queries{route="tags.list",method="GET",quantile="0.5"} 1'
+    ) in text
+    assert 'foodgram_render_duration_seconds_count{route="tags.list"' in text
+    assert (
+        'foodgram_serialize_duration_seconds_count{route="tags.list"'
+    ) in text
+
+    user.is_staff = True
+    user.save()
+    client.force_login(user)
+    assert client.get('/api/metrics/').status_code == 200
+
+
+def test_query_count_header_off_by_default(settings):
+    assert settings.METRICS_QUERY_COUNT_HEADER is False
+
@@ -0,0 +1,237 @@
+"""
+Число SQL-запросов на каждый GET-маршрут router_v1 не должно зависеть
+от числа строк в ответе и не должно превышать бюджет из
+query_budgets.json. Бюджеты записаны отдельно для каждой СУБД:
+на PostgreSQL лента рецептов читает оценку числа строк из pg_class.
+Пересчитать бюджет после осознанного изменения:
+
+    UPDATE_QUERY_BUDGETS=1 python -m pytest tests/test_query_counts.py
+"""
+import io
+import json
+import os
+import re
+from collections import Counter
+from pathlib import Path
+
+import pytest
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.cache import get_cache
+from api.indexes import ingredient_index, recipe_ingredient_index, tag_index
+from api.urls import router_v1
+from recipes.models import (
+    Cart,
+    CartIngredientTotal,
+    Favourite,
+    Follow,
+    Ingredient,
+    IngredientAmount,
+    Recipe,
+    Tag,
+    User
+)
+
+BUDGETS_FILE = Path(__file__).with_name('query_budgets.json')
+SIZES = (2, 5)
+# Параметры маршрутов, без которых запрос невалиден, и дополнительные
+# варианты запросов; в значениях подставляются id из фикстуры objects.
+REQUIRED_PARAMS = {
+    'recipes-by_ingredients': {'ingredients': '{ingredients}'},
+}
+VARIANTS = {
+    'recipes-list': (
+        {'is_favorited': 1},
+        {'is_in_shopping_cart': 1},
+        {'tags': 'tag0'},
+        {'tags': 'tag0', 'tags_mode': 'and'},
+        {'author': '{users}'},
+        {'search': 'рецепт'},
+    ),
+    'users-list': ({'is_subscribed': 1},),
+    'users-subscriptions': ({'recipes_limit': 1},),
+}
+
+
+def get_routes():
+    return [
+        pattern for pattern in router_v1.urls
+        if 'get' in pattern.callback.actions
+    ]
+
+
+def get_cases():
+    cases = []
+    for pattern in get_routes():
+        cases.append((pattern.name, REQUIRED_PARAMS.get(pattern.name, {})))
+        for params in VARIANTS.get(pattern.name, ()):
+            cases.append((pattern.name, params))
+    return cases
+
+
+def case_id(name, params):
+    query = '&'.join(f'{key}={value}' for key, value in params.items())
+    return f'{name}?{query}' if query else name
+
+
+def load_budgets():
+    with open(BUDGETS_FILE, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def add_rows(user, first, last):
+    """
+    Добавляет авторов с рецептами, тегами и ингредиентами; user подписан
+    на всех авторов, а все рецепты у него в избранном и в корзине.
+    Каждый рецепт получает все теги и ингредиенты, так что растут
+    и списки, и вложенные коллекции одного рецепта.
+    """
+    for number in range(first, last):
+        author = User.objects.create_user(
+            username=f'author{number}',
+            email=f'author{number}@example.com',
+            password='test',
+        )
+        Tag.objects.create(
+            name=f'Тег {number}',
+            color=f'#{number:06x}',
+            slug=f'tag{number}',
+            author=author,
+        )
+        Ingredient.objects.create(
+            name=f'ингредиент {number}', measurement_unit='г'
+        )
+        recipe = Recipe.objects.create(
+            author=author,
+            name=f'Рецепт {number}',
+            text='Текст',
+            cooking_time=number + 1,
+        )
+        Follow.objects.create(user=user, author=author)
+        Favourite.objects.create(user=user, recipe=recipe)
+        Cart.objects.create(user=user, recipe=recipe)
+    tags = list(Tag.objects.all())
+    ingredients = Ingredient.objects.all()
+    for recipe in Recipe.objects.all():
+        recipe.tags.set(tags)
+        IngredientAmount.objects.bulk_create(
+            (
+                IngredientAmount(
+                    recipe=recipe, ingredient=ingredient, amount=10
+                )
+                for ingredient in ingredients
+            ),
+            ignore_conflicts=True
+        )
+    CartIngredientTotal.objects.rebuild()
+
+
+def url_kwargs(pattern, objects):
+    kwargs = {}
+    for name in pattern.pattern.regex.groupindex:
+        if name == 'rendition':
+            kwargs[name] = 'card'
+        else:
+            kwargs[name] = objects[pattern.name.split('-')[0]]
+    return kwargs
+
+
+def measure(client, path, params):
+    """Запрос с холодным кэшем: считаются все запросы к БД."""
+    get_cache().clear()
+    cache.clear()
+    ingredient_index.invalidate()
+    recipe_ingredient_index.invalidate()
+    tag_index.invalidate()
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(path, params)
+        if response.streaming:
+            b''.join(response.streaming_content)
+    assert response.status_code < 400, (path, response.status_code)
+    return [query['sql'] for query in queries]
+
+
+def normalize(sql):
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    return re.sub(r'IN \([?, ]+\)', 'IN (...)', sql)
+
+
+def report(title, queries):
+    lines = [title]
+    for sql, count in Counter(map(normalize, queries)).most_common():
+        lines.append(f'  {count} x {sql}')
+    return '\n'.join(lines)
+
+
+@pytest.fixture
+def objects(user, media_root):
+    """Первые объекты каждого маршрута; у рецепта есть картинка."""
+    add_rows(user, 0, SIZES[0])
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), 'red').save(buffer, 'JPEG')
+    recipe = Recipe.objects.order_by('id').first()
+    recipe.image.save('image.jpg', ContentFile(buffer.getvalue()))
+    return {
+        'recipes': recipe.id,
+        'users': User.objects.get(username='author0').id,
+        'tags': Tag.objects.order_by('id').first().id,
+        'ingredients': Ingredient.objects.order_by('id').first().id,
+    }
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    'name, params', get_cases(),
+    ids=[case_id(*case) for case in get_cases()]
+)
+def test_query_count(user, objects, name, params):
+    pattern = next(item for item in get_routes() if item.name == name)
+    path = reverse(name, kwargs=url_kwargs(pattern, objects))
+    query = {
+        key: value.format(**objects) if isinstance(value, str) else value
+        for key, value in params.items()
+    }
+    client = APIClient()
+    client.force_authenticate(user)
+
+    small = measure(client, path, query)
+    add_rows(user, *SIZES)
+    large = measure(client, path, query)
+    key = case_id(name, params)
+
+    if os.getenv('UPDATE_QUERY_BUDGETS'):
+        budgets = load_budgets()
+        budgets.setdefault(connection.vendor, {})[key] = len(large)
+        with open(BUDGETS_FILE, 'w', encoding='utf-8') as file:
+            json.dump(
+                budgets, file, ensure_ascii=False, indent=2, sort_keys=True
+            )
+            file.write('\n')
+    assert len(large) <= len(small), report(
+        f'{key}: {len(small)} запросов при {SIZES[0]} строках, '
+        f'{len(large)} при {SIZES[1]}',
+        large
+    )
+    budget = load_budgets().get(connection.vendor, {}).get(key)
+    assert budget is not None, (
+        f'{key}: нет бюджета для {connection.vendor} в {BUDGETS_FILE.name}, '
+        f'сейчас {len(large)} запросов'
+    )
+    assert len(large) <= budget, report(
+        f'{key}: {len(large)} запросов при бюджете {budget}', large
+    )
+
+
+def test_budgets_match_routes():
+    cases = {case_id(name, params) for name, params in get_cases()}
+    for vendor, budgets in load_budgets().items():
+        assert set(budgets) <= cases, (
+            f'{vendor}: бюджеты для удалённых маршрутов'
+        )
@@ -0,0 +1,306 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.feed import cache_ttl
+from recipes.models import (
+    Cart,
+    Favourite,
+    Follow,
+    Ingredient,
+    IngredientAmount,
+    Recipe
+)
+
+
+@pytest.mark.django_db
+def test_recipe_list_user_flags(user_client, user, another_user, recipe):
+    foreign_recipe = Recipe.objects.create(
+        author=another_user,
+        name='Recipe #2',
+        text='Test recipe',
+        cooking_time=1,
+    )
+    Favourite.objects.create(user=user, recipe=foreign_recipe)
+    Cart.objects.create(user=user, recipe=recipe)
+    Follow.objects.create(user=user, author=another_user)
+
+    response = user_client.get('/api/recipes/')
+    assert response.status_code == 200
+    results = {item['id']: item for item in response.data['results']}
+    assert results[foreign_recipe.id]['is_favorited'] is True
+    assert results[foreign_recipe.id]['is_in_shopping_cart'] is False
+    assert results[foreign_recipe.id]['author']['is_subscribed'] is True
+    assert results[recipe.id]['is_favorited'] is False
+    assert results[recipe.id]['is_in_shopping_cart'] is True
+    assert results[recipe.id]['author']['is_subscribed'] is False
+
+    response = user_client.get('/api/recipes/', {'is_favorited': 1})
+    assert [item['id'] for item in response.data['results']] == [
+        foreign_recipe.id
+    ]
+
+
+@pytest.mark.django_db
+def test_recipe_list_anonymous(client, recipe):
+    response = client.get('/api/recipes/', {'is_favorited': 1})
+    assert response.status_code == 200
+    assert response.data['results'] == []
+    response = client.get('/api/recipes/')
+    assert response.data['results'][0]['is_favorited'] is False
+
+
+def make_recipes(author, tag, count, ingredients_per_recipe):
+    for number in range(count):
+        recipe = Recipe.objects.create(
+            author=author,
+            name=f'Recipe {number}',
+            text='Test recipe',
+            cooking_time=1,
+        )
+        recipe.tags.add(tag)
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
+                recipe=recipe,
+                ingredient=Ingredient.objects.create(
+                    name=f'ingredient {number}-{position}',
+                    measurement_unit='г',
+                ),
+                amount=1,
+            )
+            for position in range(ingredients_per_recipe)
+        )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('count,ingredients_per_recipe', [(1, 1), (6, 15)])
+def test_recipe_list_query_count(
+    django_assert_num_queries, settings, user_client, user, tag,
+    count, ingredients_per_recipe
+):
+    settings.RECIPE_COUNT_ESTIMATE_MIN = None
+    make_recipes(user, tag, count, ingredients_per_recipe)
+    # count, page, user favourites, carts and follows,
+    # recipes, tags, ingredients
+    with django_assert_num_queries(8):
+        response = user_client.get('/api/recipes/')
+    assert response.status_code == 200
+    assert len(response.data['results']) == count
+    assert len(response.data['results'][0]['ingredients']) == (
+        ingredients_per_recipe
+    )
+    # page
+    with django_assert_num_queries(1):
+        assert user_client.get('/api/recipes/').data == response.data
+
+
+@pytest.mark.django_db
+def test_recipe_detail_query_count(
+    django_assert_num_queries, user_client, user, tag
+):
+    make_recipes(user, tag, 1, 15)
+    recipe = Recipe.objects.get()
+    # recipe, tags, ingredients
+    with django_assert_num_queries(3):
+        response = user_client.get(f'/api/recipes/{recipe.id}/')
+    assert response.status_code == 200
+    assert len(response.data['ingredients']) == 15
+
+
+@pytest.mark.django_db
+def test_recipe_create_and_update_ingredients(
+    media_root, image_base64, user_client, tag
+):
+    salt, sugar, flour = (
+        Ingredient.objects.create(name=name, measurement_unit='г')
+        for name in ('соль', 'сахар', 'мука')
+    )
+    payload = {
+        'ingredients': [
+            {'id': salt.id, 'amount': 5},
+            {'id': sugar.id, 'amount': 10},
+        ],
+        'tags': [tag.id],
+        'image': image_base64,
+        'name': 'Recipe',
+        'text': 'Test recipe',
+        'cooking_time': 1,
+    }
+    response = user_client.post('/api/recipes/', payload, format='json')
+    assert response.status_code == 201, response.data
+    recipe_id = response.data['id']
+    salt_row = IngredientAmount.objects.get(
+        recipe_id=recipe_id, ingredient=salt
+    )
+
+    payload['ingredients'] = [
+        {'id': salt.id, 'amount': 5},
+        {'id': flour.id, 'amount': 200},
+    ]
+    response = user_client.patch(
+        f'/api/recipes/{recipe_id}/', payload, format='json'
+    )
+    assert response.status_code == 200, response.data
+    assert IngredientAmount.objects.get(
+        recipe_id=recipe_id, ingredient=salt
+    ).id == salt_row.id
+    assert dict(
+        IngredientAmount.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', 'amount')
+    ) == {salt.id: 5, flour.id: 200}
+    assert {
+        item['id'] for item in response.data['ingredients']
+    } == {salt.id, flour.id}
+
+    payload['ingredients'] = [
+        {'id': salt.id, 'amount': 5},
+        {'id': salt.id, 'amount': 7},
+    ]
+    response = user_client.post('/api/recipes/', payload, format='json')
+    assert response.status_code == 400
+    assert 'ingredients' in response.data
+
+
+@pytest.mark.django_db
+def test_recipe_list_keyset_pagination(client, user, tag):
+    make_recipes(user, tag, 7, 1)
+    response = client.get(
+        '/api/recipes/', {'pagination': 'cursor', 'limit': 3}
+    )
+    assert response.status_code == 200
+    assert 'count' not in response.data
+    ids = [item['id'] for item in response.data['results']]
+    while response.data['next']:
+        response = client.get(response.data['next'])
+        ids.extend(item['id'] for item in response.data['results'])
+    assert ids == list(Recipe.objects.values_list('id', flat=True))
+
+
+@pytest.mark.django_db
+def test_recipe_list_limit(client, user, tag):
+    make_recipes(user, tag, 3, 1)
+    response = client.get('/api/recipes/', {'limit': 2})
+    assert response.data['count'] == 3
+    assert len(response.data['results']) == 2
+
+
+@pytest.mark.django_db
+def test_recipe_list_count_is_cached(
+    django_assert_num_queries, user_client, user, tag
+):
+    make_recipes(user, tag, 2, 1)
+    user_client.get('/api/recipes/')
+    # page
+    with django_assert_num_queries(1):
+        response = user_client.get('/api/recipes/', {'page': 1})
+    assert response.data['count'] == 2
+
+    make_recipes(user, tag, 1, 1)
+    response = user_client.get('/api/recipes/')
+    assert response.data['count'] == 3
+
+
+@pytest.mark.django_db
+def test_recipe_list_user_count_invalidation(user_client, user, tag):
+    make_recipes(user, tag, 2, 1)
+    response = user_client.get('/api/recipes/', {'is_favorited': 1})
+    assert response.data['count'] == 0
+    recipe = Recipe.objects.first()
+    user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+    response = user_client.get('/api/recipes/', {'is_favorited': 1})
+    assert response.data['count'] == 1
+
+
+def test_feed_cache_ttl_capped_for_local_cache(settings, tmp_path):
+    settings.RECIPE_LOCAL_CACHE_TTL = 60
+    assert cache_ttl(86400) == 60
+    settings.CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(tmp_path),
+    }}
+    assert cache_ttl(86400) == 86400
+
+
+@pytest.mark.django_db(transaction=True)
+def test_recipe_feed_cache_invalidation(
+    user_client, user, another_user, tag
+):
+    make_recipes(another_user, tag, 2, 1)
+    first, second = Recipe.objects.order_by('id')
+    user_client.get('/api/recipes/')
+
+    second.name = 'Renamed'
+    second.save()
+    user_client.post(f'/api/recipes/{first.id}/shopping_cart/')
+    user_client.post(f'/api/users/{another_user.id}/subscribe/')
+
+    results = {
+        item['id']: item
+        for item in user_client.get('/api/recipes/').data['results']
+    }
+    assert results[second.id]['name'] == 'Renamed'
+    assert results[first.id]['is_in_shopping_cart'] is True
+    assert results[second.id]['is_in_shopping_cart'] is False
+    assert results[first.id]['author']['is_subscribed'] is True
+
+    another_user.first_name = 'Author'
+    another_user.save()
+    response = user_client.get('/api/recipes/')
+    assert {
+        item['author']['first_name'] for item in response.data['results']
+    } == {'Author'}
+
+    first.ingredients.get().ingredient.delete()
+    tag.delete()
+    results = {
+        item['id']: item
+        for item in user_client.get('/api/recipes/').data['results']
+    }
+    assert results[first.id]['ingredients'] == []
+    assert results[second.id]['tags'] == []
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    'url,model', [('favorite', Favourite), ('shopping_cart', Cart)]
+)
+def test_recipe_toggle(user_client, user, recipe, url, model):
+    table = connection.ops.quote_name(model._meta.db_table)
+
+    def writes(queries):
+        return [
+            query['sql'] for query in queries.captured_queries
+            if table in query['sql'] and not query['sql'].startswith('SELECT')
+        ]
+
+    with CaptureQueriesContext(connection) as queries:
+        response = user_client.post(f'/api/recipes/{recipe.id}/{url}/')
+    assert response.status_code == 201
+    assert response.data['id'] == recipe.id
+    assert len(writes(queries)) == 1
+    assert writes(queries)[0].startswith('INSERT')
+    response = user_client.post(f'/api/recipes/{recipe.id}/{url}/')
+    assert response.status_code == 400
+    assert model.objects.filter(user=user).count() == 1
+
+    with CaptureQueriesContext(connection) as queries:
+        response = user_client.delete(f'/api/recipes/{recipe.id}/{url}/')
+    assert response.status_code == 204
+    assert len(writes(queries)) == 1
+    assert writes(queries)[0].startswith('DELETE')
+    response = user_client.delete(f'/api/recipes/{recipe.id}/{url}/')
+    assert response.status_code == 400
+    assert not model.objects.filter(user=user).exists()
+
+
+@pytest.mark.django_db
+def test_recipe_toggle_checks_recipe_not_row_id(user_client, user, recipe):
+    second = Recipe.objects.create(
+        id=10 ** 6, author=user, name='Second', text='Test', cooking_time=1
+    )
+    Favourite.objects.create(id=second.id, user=user, recipe=recipe)
+    response = user_client.post(f'/api/recipes/{second.id}/favorite/')
+    assert response.status_code == 201
+    response = user_client.post('/api/recipes/0/favorite/')
+    assert response.status_code == 404
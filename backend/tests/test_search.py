@@ -0,0 +1,127 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Follow, Ingredient, IngredientAmount, Recipe
+
+
+@pytest.fixture
+def borscht_recipes(user, tag, ingredient):
+    by_name = Recipe.objects.create(
+        author=user, name='Борщ', text='Суп со свёклой', cooking_time=60
+    )
+    by_text = Recipe.objects.create(
+        author=user, name='Щи', text='Готовятся почти как борщ',
+        cooking_time=40
+    )
+    by_ingredient = Recipe.objects.create(
+        author=user, name='Салат', text='Нарезать', cooking_time=5
+    )
+    unrelated = Recipe.objects.create(
+        author=user, name='Омлет', text='Взбить яйца', cooking_time=10
+    )
+    dressing = Ingredient.objects.create(
+        name='заправка для борща', measurement_unit='г'
+    )
+    IngredientAmount.objects.create(
+        recipe=by_ingredient, ingredient=dressing, amount=1
+    )
+    IngredientAmount.objects.create(
+        recipe=unrelated, ingredient=ingredient, amount=1
+    )
+    Recipe.objects.update_search_vectors(
+        (by_ingredient.id, unrelated.id)
+    )
+    return by_name, by_ingredient, by_text, unrelated
+
+
+def ids(response):
+    assert response.status_code == 200
+    return [item['id'] for item in response.data['results']]
+
+
+@pytest.mark.django_db
+def test_search_ranks_name_over_ingredients_over_text(
+        client, borscht_recipes
+):
+    by_name, by_ingredient, by_text, _ = borscht_recipes
+
+    response = client.get('/api/recipes/', {'search': 'борщ'})
+
+    assert ids(response) == [by_name.id, by_ingredient.id, by_text.id]
+    assert response.data['count'] == 3
+
+
+@pytest.mark.django_db
+def test_search_index_follows_changes(client, borscht_recipes):
+    by_name, by_ingredient, _, unrelated = borscht_recipes
+
+    unrelated.name = 'Омлет к борщу'
+    unrelated.save()
+    dressing = Ingredient.objects.get(name='заправка для борща')
+    dressing.name = 'заправка для солянки'
+    dressing.save()
+    by_name.delete()
+
+    assert ids(client.get('/api/recipes/', {'search': 'омлет'})) == [
+        unrelated.id
+    ]
+    found = ids(client.get('/api/recipes/', {'search': 'борщ'}))
+    assert unrelated.id in found
+    assert by_ingredient.id not in found
+    assert by_name.id not in found
+    assert ids(client.get('/api/recipes/', {'search': 'солянки'})) == [
+        by_ingredient.id
+    ]
+
+
+@pytest.mark.django_db
+def test_created_recipe_is_searchable_by_ingredient(
+        user_client, tag, ingredient, image_base64, media_root, settings
+):
+    settings.IMAGE_PROCESSING_BACKEND = 'sync'
+    response = user_client.post('/api/recipes/', {
+        'ingredients': [{'id': ingredient.id, 'amount': 10}],
+        'tags': [tag.id],
+        'image': image_base64,
+        'name': 'Новый рецепт',
+        'text': 'Описание',
+        'cooking_time': 10,
+    }, format='json')
+    assert response.status_code == 201
+
+    assert ids(user_client.get('/api/recipes/', {'search': 'test'})) == [
+        response.data['id']
+    ]
+
+
+@pytest.mark.django_db
+def test_search_ignores_query_syntax(client, borscht_recipes):
+    assert ids(client.get('/api/recipes/', {'search': '"*:('})) == []
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('params', [
+    {'pagination': 'cursor'}, {'cursor': 'cD0x'}
+])
+def test_search_rejects_cursor_pagination(client, params):
+    response = client.get('/api/recipes/', {'search': 'борщ', **params})
+    assert response.status_code == 400
+    assert 'search' in response.data
+
+
+@pytest.mark.django_db
+def test_search_vector_not_loaded(user_client, user, another_user, recipe):
+    Follow.objects.create(user=user, author=another_user)
+    Recipe.objects.create(
+        author=another_user, name='Щи', text='Текст', cooking_time=1
+    )
+
+    with CaptureQueriesContext(connection) as queries:
+        user_client.get('/api/recipes/')
+        user_client.get(f'/api/recipes/{recipe.id}/')
+        user_client.get('/api/users/subscriptions/', {'recipes_limit': 2})
+
+    sql = [query['sql'] for query in queries.captured_queries]
+    assert any('recipe_rank' in query for query in sql)
+    assert not any('search_vector' in query for query in sql)
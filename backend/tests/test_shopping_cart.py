@@ -0,0 +1,250 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from rest_framework.test import APIClient
+
+from recipes.models import (
+    Cart,
+    CartIngredientTotal,
+    Ingredient,
+    IngredientAmount,
+    Recipe
+)
+
+
+@pytest.fixture
+def cart(user, recipe, recipe_ingredient):
+    return Cart.objects.create(user=user, recipe=recipe)
+
+
+def download(client, **params):
+    response = client.get('/api/recipes/download_shopping_cart/', params)
+    assert response.status_code == 200
+    return response, b''.join(response.streaming_content).decode()
+
+
+@pytest.mark.django_db
+def test_download_shopping_cart_empty(user_client):
+    response = user_client.get('/api/recipes/download_shopping_cart/')
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_download_shopping_cart_txt(user_client, cart):
+    response, content = download(user_client)
+    assert response['Content-Type'] == 'text/plain; charset=utf-8'
+    assert content.splitlines()[1] == 'test: 1 test'
+
+
+@pytest.mark.django_db
+def test_download_shopping_cart_csv(user_client, cart):
+    response, content = download(user_client, format='csv')
+    assert response['Content-Disposition'].endswith('.csv')
+    assert content.splitlines() == [
+        'name,amount,measurement_unit', 'test,1,test'
+    ]
+
+
+@pytest.mark.django_db
+def test_download_shopping_cart_json(user_client, cart):
+    _, content = download(user_client, format='json')
+    assert json.loads(content)['ingredients'] == [
+        {'name': 'test', 'measurement_unit': 'test', 'amount': 1}
+    ]
+
+
+def cart_totals(user):
+    return dict(
+        CartIngredientTotal.objects.filter(
+            user=user
+        ).values_list('ingredient__name', 'amount')
+    )
+
+
+@pytest.mark.django_db
+def test_cart_totals_follow_cart_and_recipe_changes(
+    media_root, image_base64, user_client, user, another_user, tag, ingredient
+):
+    salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+    first, second = (
+        Recipe.objects.create(
+            author=another_user, name=name, text='text', cooking_time=1
+        )
+        for name in ('first', 'second')
+    )
+    IngredientAmount.objects.bulk_create((
+        IngredientAmount(recipe=first, ingredient=ingredient, amount=2),
+        IngredientAmount(recipe=first, ingredient=salt, amount=1),
+        IngredientAmount(recipe=second, ingredient=ingredient, amount=3),
+    ))
+    for recipe in (first, second):
+        response = user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        assert response.status_code == 201
+    assert cart_totals(user) == {'test': 5, 'соль': 1}
+
+    author_client = APIClient()
+    author_client.force_authenticate(another_user)
+    response = author_client.patch(
+        f'/api/recipes/{second.id}/',
+        {
+            'ingredients': [{'id': salt.id, 'amount': 4}],
+            'tags': [tag.id],
+            'image': image_base64,
+            'name': 'second',
+            'text': 'text',
+            'cooking_time': 1,
+        },
+        format='json'
+    )
+    assert response.status_code == 200, response.data
+    assert cart_totals(user) == {'test': 2, 'соль': 5}
+
+    response = user_client.delete(f'/api/recipes/{first.id}/shopping_cart/')
+    assert response.status_code == 204
+    assert cart_totals(user) == {'соль': 4}
+
+    second.delete()
+    assert cart_totals(user) == {}
+
+
+@pytest.mark.django_db
+def test_rebuild_cart_totals_command(user, cart):
+    CartIngredientTotal.objects.filter(user=user).update(amount=7)
+    with pytest.raises(CommandError):
+        call_command('rebuild_cart_totals', '--check', stdout=StringIO())
+    call_command('rebuild_cart_totals', stdout=StringIO())
+    call_command('rebuild_cart_totals', '--check', stdout=StringIO())
+    assert cart_totals(user) == {'test': 1}
+
+
+@pytest.mark.django_db
+def test_shopping_cart_batch(
+    django_assert_max_num_queries, user_client, user, cart, ingredient
+):
+    other = Recipe.objects.create(
+        author=user, name='Other', text='Test recipe', cooking_time=1
+    )
+    IngredientAmount.objects.create(
+        recipe=other, ingredient=ingredient, amount=2
+    )
+    # проверка id, INSERT, пересчёт итогов корзины и savepoint'ы
+    with django_assert_max_num_queries(7):
+        response = user_client.post(
+            '/api/recipes/shopping_cart/',
+            {'ids': [cart.recipe_id, other.id, 10 ** 6, other.id]},
+            format='json'
+        )
+    assert response.status_code == 200
+    assert response.data == [
+        {'id': cart.recipe_id, 'status': 'exists'},
+        {'id': other.id, 'status': 'created'},
+        {'id': 10 ** 6, 'status': 'not_found'},
+    ]
+    assert cart_totals(user) == {'test': 3}
+    response = user_client.post(
+        '/api/recipes/shopping_cart/', {'ids': []}, format='json'
+    )
+    assert response.status_code == 400
+
+
+def assert_cart_totals_consistent():
+    expected = {
+        (row['user'], row['ingredient']): row['total']
+        for row in CartIngredientTotal.objects.expected()
+    }
+    assert dict(
+        ((total.user_id, total.ingredient_id), total.amount)
+        for total in CartIngredientTotal.objects.all()
+    ) == expected
+
+
+@pytest.mark.django_db
+def test_cart_totals_follow_amount_patch(
+    media_root, image_base64, user_client, user, another_user, tag,
+    cart, recipe, ingredient
+):
+    Cart.objects.create(user=another_user, recipe=recipe)
+    salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    response = user_client.patch(
+        f'/api/recipes/{recipe.id}/',
+        {
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 3},
+                {'id': salt.id, 'amount': 2},
+            ],
+            'tags': [tag.id],
+            'image': image_base64,
+            'name': 'Recipe #1',
+            'text': 'text',
+            'cooking_time': 1,
+        },
+        format='json'
+    )
+
+    assert response.status_code == 200, response.data
+    assert cart_totals(another_user) == {'test': 3, 'соль': 2}
+    assert_cart_totals_consistent()
+
+
+@pytest.mark.django_db
+def test_cart_totals_follow_admin_edit(client, user, cart, recipe_ingredient):
+    user.is_staff = user.is_superuser = True
+    user.save()
+    client.force_login(user)
+    recipe = recipe_ingredient.recipe
+
+    response = client.post(f'/admin/recipes/recipe/{recipe.id}/change/', {
+        'author': user.id,
+        'name': recipe.name,
+        'text': recipe.text,
+        'tags': [tag.id for tag in recipe.tags.all()],
+        'cooking_time': 1,
+        'ingredients-TOTAL_FORMS': 1,
+        'ingredients-INITIAL_FORMS': 1,
+        'ingredients-0-id': recipe_ingredient.id,
+        'ingredients-0-recipe': recipe.id,
+        'ingredients-0-ingredient': recipe_ingredient.ingredient_id,
+        'ingredients-0-amount': 5,
+    })
+
+    assert response.status_code == 302
+    assert cart_totals(user) == {'test': 5}
+    assert_cart_totals_consistent()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_cart_totals_follow_admin_cart_changes(
+        client, user_client, user, recipe_ingredient
+):
+    user.is_staff = user.is_superuser = True
+    user.save()
+    client.force_login(user)
+    recipe = recipe_ingredient.recipe
+    assert user_client.get(
+        '/api/recipes/', {'is_in_shopping_cart': 1}
+    ).data['count'] == 0
+
+    response = client.post(
+        '/admin/recipes/cart/add/', {'user': user.id, 'recipe': recipe.id}
+    )
+    assert response.status_code == 302
+    assert cart_totals(user) == {'test': 1}
+    assert_cart_totals_consistent()
+    response = user_client.get('/api/recipes/', {'is_in_shopping_cart': 1})
+    assert response.data['count'] == 1
+    assert response.data['results'][0]['is_in_shopping_cart'] is True
+
+    cart = Cart.objects.get(user=user)
+    response = client.post(
+        f'/admin/recipes/cart/{cart.id}/delete/', {'post': 'yes'}
+    )
+    assert response.status_code == 302
+    assert cart_totals(user) == {}
+    assert user_client.get(
+        '/api/recipes/', {'is_in_shopping_cart': 1}
+    ).data['count'] == 0
+
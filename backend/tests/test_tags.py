@@ -0,0 +1,141 @@
+import pytest
+
+from api.indexes import bitset_size, from_bitset, tag_index
+from recipes.models import Recipe, Tag
+
+
+@pytest.mark.django_db
+def test_tag_list_cache_and_etag(django_assert_num_queries, client, tag):
+    response = client.get('/api/tags/')
+    assert response.status_code == 200
+    etag = response['ETag']
+    last_modified = response['Last-Modified']
+
+    with django_assert_num_queries(0):
+        response = client.get('/api/tags/')
+    assert response.data[0]['slug'] == tag.slug
+    assert response['ETag'] == etag
+
+    with django_assert_num_queries(0):
+        response = client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    response = client.get('/api/tags/', HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert response.status_code == 304
+
+
+@pytest.mark.django_db
+def test_tag_list_cache_invalidation(client, user, tag):
+    etag = client.get('/api/tags/')['ETag']
+    Tag.objects.create(name='Обед', color='98ff98', slug='lunch', author=user)
+    response = client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert {item['slug'] for item in response.data} == {tag.slug, 'lunch'}
+
+
+@pytest.fixture
+def tagged_recipes(user, tag):
+    lunch = Tag.objects.create(
+        name='Обед', color='98ff98', slug='lunch', author=user
+    )
+    dinner = Tag.objects.create(
+        name='Ужин', color='8a2be2', slug='dinner', author=user
+    )
+    recipes = {}
+    for name, tags in (
+        ('both', (tag, lunch)), ('test', (tag,)), ('late', (lunch, dinner)),
+        ('none', ())
+    ):
+        recipes[name] = Recipe.objects.create(
+            author=user, name=name, text='Текст', cooking_time=1
+        )
+        recipes[name].tags.set(tags)
+    return recipes
+
+
+def recipe_ids(response):
+    assert response.status_code == 200, response.data
+    return sorted(item['id'] for item in response.data['results'])
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('max_ids', [1000, 0], ids=['bitset', 'subquery'])
+@pytest.mark.parametrize('mode,expected', [
+    (None, ('both', 'test', 'late')),
+    ('or', ('both', 'test', 'late')),
+    ('and', ('both',)),
+])
+def test_recipe_tags_filter(
+        settings, client, tagged_recipes, max_ids, mode, expected
+):
+    settings.TAG_FILTER_MAX_IDS = max_ids
+    params = {'tags': ['test', 'lunch']}
+    if mode:
+        params['tags_mode'] = mode
+
+    response = client.get('/api/recipes/', params)
+
+    assert recipe_ids(response) == sorted(
+        tagged_recipes[name].id for name in expected
+    )
+    assert response.data['count'] == len(expected)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('params', [
+    {'tags': 'unknown'}, {'tags': 'test', 'tags_mode': 'xor'}
+])
+def test_recipe_tags_filter_invalid(client, tagged_recipes, params):
+    assert client.get('/api/recipes/', params).status_code == 400
+    assert client.get(
+        '/api/recipes/tag_counts/', params
+    ).status_code == 400
+
+
+@pytest.mark.django_db
+def test_tag_counts(django_assert_num_queries, client, tagged_recipes):
+    response = client.get('/api/recipes/tag_counts/')
+    assert response.data == {
+        'count': 3, 'tags': {'test': 2, 'lunch': 2, 'dinner': 1}
+    }
+
+    with django_assert_num_queries(0):
+        response = client.get('/api/recipes/tag_counts/', {'tags': 'lunch'})
+    assert response.data == {
+        'count': 2, 'tags': {'test': 1, 'lunch': 2, 'dinner': 1}
+    }
+
+
+@pytest.mark.django_db(transaction=True)
+def test_tag_index_follows_changes(client, user, tag, tagged_recipes):
+    assert recipe_ids(client.get('/api/recipes/', {'tags': 'dinner'})) == [
+        tagged_recipes['late'].id
+    ]
+
+    tagged_recipes['none'].tags.add(Tag.objects.get(slug='dinner'))
+    tagged_recipes['late'].delete()
+    assert recipe_ids(client.get('/api/recipes/', {'tags': 'dinner'})) == [
+        tagged_recipes['none'].id
+    ]
+
+    Tag.objects.create(
+        name='Перекус', color='ffd700', slug='snack', author=user
+    )
+    assert client.get('/api/recipes/', {'tags': 'snack'}).data['count'] == 0
+
+
+@pytest.mark.django_db
+def test_tag_index_rebuilt_after_ttl(settings, tagged_recipes):
+    dinner = Tag.objects.get(slug='dinner')
+    assert from_bitset(tag_index.filter(['dinner'])) == [
+        tagged_recipes['late'].id
+    ]
+    # связь добавлена в другом процессе: версия в локальном кэше прежняя
+    Recipe.tags.through.objects.create(
+        recipe=tagged_recipes['none'], tag=dinner
+    )
+    assert bitset_size(tag_index.filter(['dinner'])) == 1
+
+    settings.RECIPE_INDEX_TTL = -1
+    assert from_bitset(tag_index.filter(['dinner'])) == sorted(
+        (tagged_recipes['late'].id, tagged_recipes['none'].id)
+    )
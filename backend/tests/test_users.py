@@ -0,0 +1,88 @@
+import pytest
+
+from recipes.models import Follow, Recipe, User
+
+
+@pytest.fixture
+def authors(user):
+    authors = []
+    for number in range(3):
+        author = User.objects.create(
+            email=f'author{number}@terst.test',
+            username=f'author{number}',
+        )
+        for recipe_number in range(number + 2):
+            Recipe.objects.create(
+                author=author,
+                name=f'Recipe {number}-{recipe_number}',
+                text='Test recipe',
+                cooking_time=1,
+            )
+        Follow.objects.create(user=user, author=author)
+        authors.append(author)
+    return authors
+
+
+@pytest.mark.django_db
+def test_subscriptions(django_assert_num_queries, user_client, authors):
+    # count, follows with recipes_count, recipes of all authors
+    with django_assert_num_queries(3):
+        response = user_client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 2}
+        )
+    assert response.status_code == 200
+    results = {item['id']: item for item in response.data['results']}
+    for author in authors:
+        latest = list(
+            Recipe.objects.filter(author=author).values_list('id', flat=True)
+        )
+        assert results[author.id]['recipes_count'] == len(latest)
+        assert [
+            recipe['id'] for recipe in results[author.id]['recipes']
+        ] == latest[:2]
+
+
+@pytest.mark.django_db
+def test_subscriptions_without_limit(user_client, authors):
+    response = user_client.get('/api/users/subscriptions/')
+    assert response.status_code == 200
+    assert sorted(
+        len(item['recipes']) for item in response.data['results']
+    ) == [2, 3, 4]
+
+
+@pytest.mark.django_db
+def test_subscriptions_empty_with_limit(user_client):
+    response = user_client.get(
+        '/api/users/subscriptions/', {'recipes_limit': 2}
+    )
+    assert response.status_code == 200
+    assert response.data['results'] == []
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('limit', ['abc', -1])
+def test_subscriptions_invalid_limit(user_client, user, another_user, limit):
+    response = user_client.get(
+        '/api/users/subscriptions/', {'recipes_limit': limit}
+    )
+    assert response.status_code == 400
+    response = user_client.post(
+        f'/api/users/{another_user.id}/subscribe/?recipes_limit={limit}'
+    )
+    assert response.status_code == 400
+    assert not Follow.objects.filter(user=user).exists()
+
+
+@pytest.mark.django_db
+def test_subscribe_batch(user_client, user, authors, another_user):
+    response = user_client.post(
+        '/api/users/subscribe/',
+        {'ids': [authors[0].id, another_user.id, user.id]},
+        format='json'
+    )
+    assert response.status_code == 200
+    assert [item['status'] for item in response.data] == [
+        'exists', 'created', 'not_found'
+    ]
+    assert Follow.objects.filter(user=user).count() == len(authors) + 1